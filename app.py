@@ -1,12 +1,21 @@
-from data import Feeds
 import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_table
-from setup import DataFrame
-from setup import datetime
+from df import DataFrame
+import drilldown
+from flask import Response
+import live
+import metrics
+from refresh import Refresher
+from refresh import SnapshotReader
+from setup import EXPORT_SOURCE
+from setup import LIVE_UPDATE_INTERVAL
+from setup import SERVE_MODE
+from watcher import ExportWatcher
 
 def get_progress(df: DataFrame) -> int:
     sent = len(df[df['Status'] == 'Sent'])
@@ -14,24 +23,29 @@ def get_progress(df: DataFrame) -> int:
     total = sent + not_sent
     return int(sent / total * 100)
 
-def generate_table(df: DataFrame, max_rows: int=0) -> html.Table:
-    return html.Table(
-        [html.Tr([html.Th(col) for col in df.columns])] +
-
-        [html.Tr([
-            html.Td(df.iloc[i][col]) for col in df.columns
-        ]) for i in range(max(max_rows, len(df)))]
-    )
+def get_heading(data) -> str:
+    current_time = data.refreshed_at.strftime('%Y-%m-%d %H:%M:%S')
+    return f'Progress of Feeds (as-of {current_time})'
 
+@metrics.CALLBACK_SECONDS.time(callback='layout')
 def makey_layout():
-    '''Make the layout of the page.'''
+    '''Make the layout of the page. Dash calls this on every page load.
+    The progress, its timestamp and the feeds table are filled in by
+    live_update, which runs on load and then every
+    LIVE_UPDATE_INTERVAL seconds.'''
+    data = REFRESHER.feeds
     progress_section = html.Div(children=[
-        html.H4(f'Progress of Feeds (as-of {CURRENT_TIME})'),
+        html.H4(id='progress-heading'),
         html.Div(children=[
-                dbc.Progress(children='{0}%'.format(PROGRESS), value=PROGRESS, id='progress', style={'height': '30px'}),
+                dbc.Progress(id='progress', style={'height': '30px'}),
             ]
         )], style={'padding': 10}
     )
+    live_section = html.Div(children=[
+        dcc.Interval(id='live-interval', interval=LIVE_UPDATE_INTERVAL * 1000),
+        dcc.Store(id='live-version'),                  # Data version the page shows.
+        dcc.Store(id='live-delta')                     # Last payload, applied to the table in the browser.
+    ])
 
     table1_section = dash_table.DataTable(
         id='datatable-feeds',
@@ -53,41 +67,129 @@ def makey_layout():
             'minWidth': '60px',
             'whitespace': 'normal'
         },
-        data=data.feeds.to_dict('records')
+        data=[]
     )
 
     table2_section = html.Div(children=[
         html.H4('Explore by vendor...', id='t_head2'),
         dcc.Dropdown(id='dropdown', options=[
-            {'label': i, 'value': i} for i in data.all_actuals['vendor_name'].unique()
+            {'label': i, 'value': i} for i in data.vendors
         ], multi=False, placeholder='Explore by vendor...'),
-        html.Div(id='table-container')
+        dash_table.DataTable(
+            id='datatable-vendor',
+            columns=[
+                {'name': i, 'id': i} for i in data.all_actuals.columns
+            ],
+            page_action='custom',
+            filter_action='custom',
+            sort_action='custom',
+            sort_mode='multi',
+            page_current=0,
+            page_size=DRILLDOWN_PAGE_SIZE,
+            filter_query='',
+            sort_by=[],
+            style_table={
+                'overflowX': 'scroll'
+            },
+            style_cell={
+                'height': 'auto',
+                'minWidth': '60px',
+                'whitespace': 'normal'
+            }
+        )
     ])
 
     return html.Div([
+        live_section,
         progress_section,
         table1_section,
         table2_section
     ])
 
 EXTERNAL_STYLESHEETS=['https://codepen.io/chriddyp/pen/bWLwgP.css', dbc.themes.BOOTSTRAP]
-CURRENT_TIME = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-data = Feeds()
-PROGRESS = get_progress(data.feeds)
+DRILLDOWN_PAGE_SIZE = 50
+if SERVE_MODE == 'worker':
+    REFRESHER = SnapshotReader()                       # serve.py's refresher process keeps the snapshot current.
+else:
+    REFRESHER = Refresher().start()
+    WATCHER = ExportWatcher(REFRESHER.update_exported).start() if EXPORT_SOURCE != 'scan' else None   # Scan mode rescans on refresh.
+DRILLDOWN_CACHE = drilldown.VendorCache()
+FEEDS_DELTAS = live.FeedsDeltas()
+APPLY_DELTA = '''
+function(delta, rows) {
+    if (!delta) {
+        return window.dash_clientside.no_update;
+    }
+    if (delta.full) {
+        return delta.rows;
+    }
+    var removed = new Set(delta.removed);
+    rows = (rows || []).filter(function(row) { return !removed.has(row.id); });
+    delta.added.forEach(function(added) { rows.splice(added[0], 0, added[1]); });
+    return rows;
+}
+'''                                                    # Runs in the browser (see live.py for the payload).
+metrics.LAST_REFRESH_SECONDS.set_function(lambda: getattr(REFRESHER.feeds, 'build_seconds', None))
 
 app = dash.Dash(__name__, external_stylesheets=EXTERNAL_STYLESHEETS)
-app.layout = makey_layout()
+app.layout = makey_layout
 
 @app.callback(
-    Output('table-container', 'children'),
-    [Input('dropdown', 'value')]
+    [Output('datatable-vendor', 'data'), Output('datatable-vendor', 'page_count')],
+    [
+        Input('dropdown', 'value'),
+        Input('datatable-vendor', 'page_current'),
+        Input('datatable-vendor', 'page_size'),
+        Input('datatable-vendor', 'sort_by'),
+        Input('datatable-vendor', 'filter_query')
+    ]
 )
-def display_table(dropdown_value: str) -> html.Table:
+@metrics.CALLBACK_SECONDS.time(callback='display_table')
+def display_table(dropdown_value: str, page_current: int, page_size: int, sort_by: list, filter_query: str):
+    '''Send one page of the selected vendor's files, filtered and
+    sorted on the server.'''
     if dropdown_value is None:
-        return generate_table(DataFrame(columns=data.all_actuals.columns))
+        return [], 1
+    version, data = REFRESHER.snapshot()
+    rows = DRILLDOWN_CACHE.vendor_rows(version, data, dropdown_value)
+    return drilldown.query(rows, page_current, page_size, sort_by, filter_query)
+
+@app.callback(
+    [
+        Output('live-delta', 'data'),
+        Output('live-version', 'data'),
+        Output('progress-heading', 'children'),
+        Output('progress', 'value'),
+        Output('progress', 'children')
+    ],
+    [Input('live-interval', 'n_intervals')],
+    [State('live-version', 'data')]
+)
+@metrics.CALLBACK_SECONDS.time(callback='live_update')
+def live_update(n_intervals: int, client_version):
+    '''Bring the page to the current data version: nothing is sent if
+    it is current, otherwise the rows that changed since the page's
+    version (or all rows), with the progress and its timestamp.'''
+    version, data = REFRESHER.snapshot()
+    payload = FEEDS_DELTAS.payload(version, data, client_version)
+    if payload is None:
+        metrics.LIVE_UPDATES.inc(reply='unchanged')
+        raise PreventUpdate
+    metrics.LIVE_UPDATES.inc(reply='full' if payload['full'] else 'delta')
+    progress = get_progress(data.feeds)
+    return payload, version, get_heading(data), progress, '{0}%'.format(progress)
+
+app.clientside_callback(
+    APPLY_DELTA,
+    Output('datatable-feeds', 'data'),
+    [Input('live-delta', 'data')],
+    [State('datatable-feeds', 'data')]
+)
 
-    dff = data.all_actuals[data.all_actuals['vendor_name'] == dropdown_value]
-    return generate_table(dff)
+@app.server.route('/metrics')
+def serve_metrics() -> Response:
+    '''Stage, query and callback timings for Prometheus to scrape.'''
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run_server(debug=True, port=9995)
\ No newline at end of file
@@ -0,0 +1,2 @@
+'''Benchmarks for the slow stages of building a Feeds report. Run each
+module with: python -m benchmarks.<module>'''
@@ -0,0 +1,128 @@
+from df import aggregate
+from df import DataFrame
+from df import group_and_consolidate
+import numpy as np
+import pandas as pd
+import schema
+from setup import AGGREGATIONS
+from time import perf_counter
+from typing import Callable, List, Set
+
+'''Compare condensing the actually processed data with one groupby per
+date column plus merges (the previous df.group_and_consolidate) against
+df.group_and_consolidate with the default setup.AGGREGATIONS, on a
+synthetic process_log result. The optional aggregations (file count,
+first/last file, duration percentiles) are timed separately.'''
+
+ROWS = 5_000_000
+KEYS = ['VendorName', 'Name']
+DATE_COLS = {'Download', 'Start', 'End'}
+OPTIONAL = {                                           # Not in the default setup.AGGREGATIONS.
+    'Files': ('FileName', 'count'),
+    'FirstFile': ('FileName', 'first'),
+    'LastFile': ('FileName', 'last'),
+    'DurationP50': ('Duration', 'p50'),
+    'DurationP95': ('Duration', 'p95')
+}
+
+def synthetic_actuals(n: int, vendors: int=10_000, crms: int=20) -> DataFrame:
+    '''n matched process log rows for vendors x crms keys.'''
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp('2021-05-28') + pd.to_timedelta(rng.integers(0, 86_400, n), unit='s')
+    return DataFrame({
+        'VendorName': pd.Series(rng.integers(0, vendors, n)).map('vendor{}'.format),
+        'Name': pd.Series(rng.integers(0, crms, n)).map('crm{}'.format),
+        'FileName': pd.Series(np.arange(n)).map('file{}.zip'.format),
+        'Download': start - pd.to_timedelta(rng.integers(0, 600, n), unit='s'),
+        'Start': start,
+        'End': start + pd.to_timedelta(rng.integers(1, 3_600, n), unit='s')
+    })
+
+def group_actual_data(df: DataFrame, keys: List, date_cols: Set) -> List[DataFrame]:
+    '''Condense (i.e., aggregate) DataFrame columns. For each date col,
+    find the appropriate aggregate value and group on the keys to get
+    that value. Then, return the results as a list of DataFrames for
+    future consolidation.'''
+    def _function_map() -> dict:
+        '''Dictionary of the date columns that we are interested in, and
+        the aggregate functions that we want to perform on each.'''
+        return {
+            'Download': 'min',
+            'Start': 'min',
+            'End': 'max'
+        }
+
+    def _get_grouped(df: DataFrame, keys: List, col: str, func: Callable) -> DataFrame:
+        '''Helper function to: i. Use a subset of columns from the
+        "parent" DataFrame; and, ii. Get a desired aggregate value
+        based on the keys.'''
+        _keys = keys[:]
+        _keys.append(col)
+
+        df = df[_keys]
+        df = df.groupby(keys).agg({col: func}) # agg method is equivalent to: df.groupby(keys)[col].func
+        df = df.reset_index()                  # reset_index() so that we can merge DataFrames later.
+        return df
+
+    dfs = []
+    fm = _function_map()
+
+    for i in date_cols:
+        dfs.append(_get_grouped(df, keys, i, fm[i])) # Apply the aggregation, and append it to output list.
+    
+    return dfs
+
+def consolidate_data(dfs: List[DataFrame], keys: List) -> DataFrame:
+    '''For each aggregate DataFrame (i.e., DataFrame that contains a
+    desired aggregated value), merge the DataFrames together into one
+    "unique" DataFrame.'''
+    consolidated = dfs[0] # Seed output DataFrame
+    for i in dfs[1:]:     # Already seeded ouput DataFrame, so start from index 1.
+        consolidated = consolidated.merge(
+            i,
+            left_on=keys,
+            right_on=keys,
+            how='left',
+            suffixes=['', '_r']
+        )
+    # All "duplicated" columns will end with suffix '_r'
+    # (e.g., Vendor_r_r_r). Shouldn't be any, but this is a sanity-check.
+    consolidated = consolidated.drop(columns=[col for col in consolidated.columns if col.endswith('_r')])
+    return consolidated
+
+def legacy_group_and_consolidate(df: DataFrame, keys: List, date_cols: Set) -> DataFrame:
+    '''Helper function to execute each "aggregation" and "consolidation".
+    We go from one (1) DataFrame to many, to many DataFrames back to
+    one (1).'''
+    dfs = group_actual_data(df, keys, date_cols) # 1 to Many
+    df = consolidate_data(dfs, keys)             # Many to 1
+    return df
+
+def main(n: int=ROWS):
+    df = synthetic_actuals(n)
+    for i in KEYS:
+        df[i] = df[i].astype(schema.CATEGORY)          # As in the 'actual' schema.
+    df['Duration'] = (df['End'] - df['Start']).dt.total_seconds()
+
+    start = perf_counter()
+    legacy = legacy_group_and_consolidate(df, KEYS, DATE_COLS)
+    legacy_time = perf_counter() - start
+
+    start = perf_counter()
+    default = group_and_consolidate(df, KEYS)
+    default_time = perf_counter() - start
+
+    start = perf_counter()
+    aggregate(df, KEYS, {**AGGREGATIONS, **OPTIONAL})
+    optional_time = perf_counter() - start
+
+    columns = KEYS + sorted(DATE_COLS)
+    legacy = schema.apply(legacy, 'condensed_actuals')[columns].sort_values(KEYS).reset_index(drop=True)
+    default = default[columns].sort_values(KEYS).reset_index(drop=True)
+    assert legacy.equals(default)
+    print(f'{n} rows: groupby per column + merges {legacy_time:.3f}s, '
+          f'default setup.AGGREGATIONS {default_time:.3f}s, '
+          f'with the optional aggregations too {optional_time:.3f}s')
+
+if __name__ == '__main__':
+    main()
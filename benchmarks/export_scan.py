@@ -0,0 +1,61 @@
+import argparse
+from benchmarks import stages
+from df import build_export_df
+import exportlog
+from glob import glob
+import schema
+from setup import datetime
+from setup import os
+from time import perf_counter
+from typing import List
+
+'''Check exportlog.scan against the per-vendor wildcard scan of the
+previous BuildExportFileLog.ps1 (with its results kept for every
+vendor), on the archive tree from benchmarks/synthetic.py, and time
+both. Exits non-zero if the export status differs.
+
+    python -m benchmarks.synthetic --directory bench_data --vendors 10000 --archive
+    python -m benchmarks.export_scan --directory bench_data'''
+
+def per_vendor_scan(configurations: str, archive: str, now: datetime) -> dict:
+    '''One query per jurisdiction, and one wildcard scan per vendor.'''
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    frames = {}
+    for jurisdiction, (ftp, vendors) in exportlog.jurisdictions(configurations).items():
+        ids = exportlog.vendor_ids(vendors)
+        archived = {}
+        for vendor in vendors:
+            if vendor not in ids:
+                continue
+            for path in glob(f'{archive}/{ftp}_{now.strftime(exportlog.DATE_FORMAT)}_{ids[vendor]}_*.zip'):
+                stat = os.stat(path)
+                if stat.st_mtime > midnight:
+                    archived.setdefault((ftp, ids[vendor]), []).append((os.path.basename(path), stat.st_size, stat.st_mtime))
+        for i in archived.values():
+            i.sort()
+        frames[jurisdiction] = schema.from_rows('exported', exportlog.status_rows(jurisdiction, ftp, vendors, ids, archived))
+    return frames
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Check and time the export file log scan.')
+    parser.add_argument('--directory', default='bench_data', help='Output directory of benchmarks.synthetic --archive.')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    stages.use_database(args.directory)
+    configurations, archive = f'{args.directory}/ExportFileLog', f'{args.directory}/archive'
+    now = datetime.now()
+
+    start = perf_counter()
+    expected = build_export_df(frames=per_vendor_scan(configurations, archive, now))
+    before = perf_counter() - start
+    start = perf_counter()
+    scanned = build_export_df(frames=exportlog.scan(configurations, archive, now))
+    after = perf_counter() - start
+
+    print(f'per-vendor scan: {before:.3f}s, single scan: {after:.3f}s, {len(scanned):,} rows')
+    print(scanned['Status'].value_counts().to_string())
+    if not scanned.equals(expected):
+        print('MISMATCH against the per-vendor scan')
+        raise SystemExit(1)
@@ -0,0 +1,41 @@
+from df import DataFrame
+from df import fix_file_mask
+import filemask
+from setup import datetime
+from time import perf_counter
+
+'''Compare fixing filemasks row by row (a filemask.Filemask per row, as
+df.fix_file_mask used to) against the vectorized df.fix_file_mask.'''
+
+ROWS = 1_000_000
+
+def synthetic_masks(n: int, distinct: int=5000) -> DataFrame:
+    '''n expected filemasks, drawn from a pool of distinct masks with
+    offsets of 0-3 days.'''
+    return DataFrame({
+        'FileMask': [f'vendor{i % distinct}_yyyymmdd_{{}}].csv' for i in range(n)],
+        'Offset': [i % 4 for i in range(n)]
+    })
+
+def fix_file_mask_rowwise(df: DataFrame, now: datetime) -> DataFrame:
+    '''The previous implementation: DataFrame.apply(axis=1).'''
+    df['FixedFileMask'] = df.apply(lambda x: filemask.Filemask(x['FileMask'], x['Offset'], now).mask, axis=1)
+    return df
+
+def main(n: int=ROWS):
+    now = datetime.now()
+    df = synthetic_masks(n)
+
+    start = perf_counter()
+    rowwise = fix_file_mask_rowwise(df.copy(), now)
+    rowwise_time = perf_counter() - start
+
+    start = perf_counter()
+    vectorized = fix_file_mask(df.copy(), now)
+    vectorized_time = perf_counter() - start
+
+    assert rowwise['FixedFileMask'].equals(vectorized['FixedFileMask'])
+    print(f'{n} rows: row-wise {rowwise_time:.3f}s, vectorized {vectorized_time:.3f}s')
+
+if __name__ == '__main__':
+    main()
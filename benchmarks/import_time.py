@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+'''Guard cold-start latency: import the lightweight modules in a fresh
+interpreter with -X importtime, and fail if they take longer than the
+budget or pull in a heavy dependency. Exits non-zero on failure.'''
+
+MODULES = [
+    'setup',
+    'queries',
+    'filemask',
+    'matcher'
+]
+HEAVY = [
+    'dash',
+    'pandas',
+    'pyarrow',
+    'pyodbc'
+]
+BUDGET_MS = 100
+
+def import_time(module: str) -> tuple:
+    '''Cumulative import time of module in microseconds, and the heavy
+    modules it loaded.'''
+    code = f'import sys, {module}; print(",".join(i for i in {HEAVY!r} if i in sys.modules))'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [i.strip() for i in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative = int(parts[1])
+    loaded = [i for i in result.stdout.strip().split(',') if i]
+    return cumulative, loaded
+
+def main() -> int:
+    failed = False
+    for i in MODULES:
+        cumulative, loaded = import_time(i)
+        ok = cumulative / 1000 <= BUDGET_MS and not loaded
+        failed = failed or not ok
+        print(f'{i:<10} {cumulative / 1000:>8.1f} ms {"ok" if ok else "FAIL"} {" ".join(loaded)}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
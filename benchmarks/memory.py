@@ -0,0 +1,62 @@
+import argparse
+from benchmarks import stages
+from df import configs_to_dict
+from df import df_from_sql
+from df import read_export_file
+from matcher import match_latest
+import pandas as pd
+import schema
+import setup
+from typing import List
+from watcher import latest_exports
+
+'''Report the memory of each frame built with the schema dtypes
+(schema.py) against the previous object-dtype construction, on the
+synthetic database from benchmarks/synthetic.py.
+
+    python -m benchmarks.synthetic --directory bench_data --vendors 10000 --log-rows 50000000
+    python -m benchmarks.memory --directory bench_data'''
+
+def megabytes(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+def object_frame(kind: str, rows: list) -> pd.DataFrame:
+    '''The previous construction: every column as Python objects.'''
+    return pd.DataFrame([list(i) for i in rows], columns=schema.columns(kind))
+
+def report(directory: str, engine: str='client') -> List[tuple]:
+    '''(frame, rows, object MB, schema MB) per frame.'''
+    stages.use_database(directory)
+    with setup.POOL.connection() as conn:
+        configs = setup.QUERIES.execute_sql(conn, setup.CONFIG_REGISTRY.expected(), setup.TEMPLATES[0])
+    configs_df = df_from_sql('configs', configs)
+    with setup.POOL.connection() as conn:
+        expected = setup.QUERIES.execute_sql(conn, configs_to_dict('configs', configs_df), setup.TEMPLATES[1])
+    expected_df = df_from_sql('expected', expected)
+    filemask = configs_to_dict('expected', expected_df)
+    with setup.POOL.connection() as conn:
+        if engine == 'client':
+            rows = match_latest(filemask, setup.QUERIES.execute_sql(conn, filemask, setup.TEMPLATES[3]))
+        else:
+            rows = setup.QUERIES.execute_sql(conn, filemask, setup.TEMPLATES[2])
+
+    lines = []
+    for kind, results in (('configs', configs), ('expected', expected), ('actual', rows)):
+        lines.append((kind, len(results), megabytes(object_frame(kind, results)), megabytes(schema.from_rows(kind, results))))
+    for jurisdiction, (path, _) in latest_exports(f'{directory}/exports').items():
+        untyped = pd.read_csv(path, dtype=object)
+        lines.append((f'exported ({jurisdiction})', len(untyped), megabytes(untyped), megabytes(read_export_file(path, jurisdiction))))
+    return lines
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Memory of object-dtype frames against the schema dtypes.')
+    parser.add_argument('--directory', default='bench_data', help='Output directory of benchmarks.synthetic.')
+    parser.add_argument('--engine', choices=['sql', 'client'], default='client')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(f'{"frame":>20} {"rows":>12} {"object MB":>10} {"schema MB":>10} {"saved":>7}')
+    for frame, rows, before, after in report(args.directory, args.engine):
+        saved = 1 - after / before if before else 0
+        print(f'{frame:>20} {rows:>12,} {before:>10.1f} {after:>10.1f} {saved:>7.0%}')
@@ -0,0 +1,149 @@
+import argparse
+from benchmarks import synthetic
+from connection import ConnectionPool
+from connection import SQLiteConnection
+from data import Feeds
+from queries import Queries
+from df import vendor_index
+import drilldown
+import json
+import platform
+from registry import ConfigRegistry
+import setup
+from setup import datetime
+from setup import os
+from statistics import median
+import sys
+from time import perf_counter
+from typing import Callable, List
+from watcher import latest_exports
+
+'''Time each Feeds stage (Configs, Expected, Actual, Exported,
+_get_feeds) and the data paths behind the Dash callbacks against the
+synthetic SQLite database from benchmarks/synthetic.py. Each run is
+appended to benchmarks/results.jsonl; a stage more than THRESHOLD (and
+at least MIN_DELTA seconds) slower than the median of the previous runs
+at the same scale, engine and dop is reported as a regression, and the
+exit status is non-zero.
+
+    python -m benchmarks.synthetic --directory bench_data --vendors 10000 --log-rows 50000000
+    python -m benchmarks.stages --directory bench_data'''
+
+RESULTS = f'{os.path.dirname(os.path.abspath(__file__))}/results.jsonl'
+THRESHOLD = 0.2
+MIN_DELTA = 0.01                                       # Seconds; smaller differences are noise.
+REPEAT = 3
+
+def best_of(func: Callable, repeat: int=REPEAT) -> tuple:
+    '''Best wall time of repeat calls, in seconds, and the last result.'''
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        times.append(perf_counter() - start)
+    return min(times), result
+
+def use_database(directory: str):
+    '''Point setup's POOL, TEMPLATES and CONFIG_REGISTRY at the synthetic
+    data. Queries run without the result cache, so every stage hits the
+    database.'''
+    setup.POOL = ConnectionPool(size=setup.POOL_SIZE, factory=SQLiteConnection, path=f'{directory}/vendors.db')
+    setup.TEMPLATES = synthetic.sqlite_templates()
+    setup.QUERIES = Queries()
+    setup.CONFIG_REGISTRY = ConfigRegistry(f'{directory}/configurations.json')
+
+def run(directory: str, engine: str=setup.ACTUAL_ENGINE, repeat: int=REPEAT, dop: int=setup.MATCH_DOP) -> dict:
+    '''Seconds per stage, building each stage from the previous one the
+    way Feeds.__init__ does.'''
+    use_database(directory)
+    now = datetime.now()
+    timings = {}
+
+    timings['configs'], configs = best_of(lambda: Feeds.Configs().configs, repeat)
+    timings['expected'], expected = best_of(lambda: Feeds.Expected(configs, now).expected, repeat)
+    timings[f'actual_{engine}'], actual = best_of(lambda: Feeds.Actual(expected, engine, dop=dop).actual, repeat)
+    paths = {i: v[0] for i, v in latest_exports(f'{directory}/exports').items()}
+    timings['exported'], exported = best_of(lambda: Feeds.Exported(paths).exported, repeat)
+
+    feeds = Feeds.__new__(Feeds)
+    feeds.now = now
+    feeds.configs = configs
+    feeds.expected = expected
+    feeds.all_actuals, feeds.condensed_actuals = actual
+    feeds.exported = exported
+    timings['get_feeds'], feeds.feeds = best_of(feeds._get_feeds, repeat)
+    timings['vendor_index'], feeds.vendors = best_of(lambda: vendor_index(feeds.all_actuals), repeat)
+
+    # Callbacks: the layout's feeds table, and drilldown pages of the
+    # biggest vendor (cold cache, then sorted and filtered).
+    timings['layout_records'], _ = best_of(lambda: feeds.feeds.to_dict('records'), repeat)
+    vendor = max(feeds.vendors, key=lambda i: len(feeds.vendors[i]), default=None)
+    if vendor is not None:
+        timings['drilldown_cold'], _ = best_of(lambda: drilldown.query(
+            drilldown.VendorCache().vendor_rows(0, feeds, vendor), 0, 50
+        ), repeat)
+        cache = drilldown.VendorCache()
+        timings['drilldown_sort_filter'], _ = best_of(lambda: drilldown.query(
+            cache.vendor_rows(0, feeds, vendor),
+            1,
+            50,
+            [{'column_id': 'Download', 'direction': 'desc'}],
+            '{Name} contains crm'
+        ), repeat)
+
+    return {
+        'engine': engine,
+        'dop': dop,
+        'timings': timings,
+        'rows': {
+            'expected': len(expected),
+            'all_actuals': len(feeds.all_actuals),
+            'exported': len(exported),
+            'feeds': len(feeds.feeds)
+        }
+    }
+
+def read_results(path: str=RESULTS) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(i) for i in f if i.strip()]
+
+def regressions(result: dict, previous: List[dict], threshold: float=THRESHOLD, min_delta: float=MIN_DELTA) -> dict:
+    '''Stages slower than (1 + threshold) x the median of previous runs
+    with the same number of rows, engine and dop, by at least min_delta
+    seconds, as {stage: (seconds, median)}.'''
+    key = lambda i: (i['rows'], i.get('engine'), i.get('dop'))
+    same = [i for i in previous if key(i) == key(result)]
+    slower = {}
+    for stage, seconds in result['timings'].items():
+        history = [i['timings'][stage] for i in same if stage in i['timings']]
+        if history and seconds - median(history) > max(median(history) * threshold, min_delta):
+            slower[stage] = (seconds, median(history))
+    return slower
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Time the Feeds stages against the synthetic database.')
+    parser.add_argument('--directory', default='bench_data', help='Output directory of benchmarks.synthetic.')
+    parser.add_argument('--engine', choices=['sql', 'client'], default=setup.ACTUAL_ENGINE)
+    parser.add_argument('--dop', type=int, default=setup.MATCH_DOP, help="Parallel shards for the 'sql' engine.")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--results', default=RESULTS)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--min-delta', type=float, default=MIN_DELTA, help='Seconds a stage must slow down by to be reported.')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = run(args.directory, args.engine, args.repeat, args.dop)
+    result.update({
+        'run_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version()
+    })
+    slower = regressions(result, read_results(args.results), args.threshold, args.min_delta)
+    for stage, seconds in result['timings'].items():
+        flag = ' REGRESSION (median {:.3f}s)'.format(slower[stage][1]) if stage in slower else ''
+        print(f'{stage:>24}: {seconds:8.3f}s{flag}')
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    sys.exit(1 if slower else 0)
@@ -0,0 +1,377 @@
+import argparse
+import csv
+from datetime import datetime, timedelta
+import filemask
+import json
+import os
+import queries
+import random
+import sqlite3
+from typing import List
+
+'''Generate a synthetic, local stand-in for the production vendor
+database: the vendors, crm, feed_config, feed_types, file_config and
+process_log tables in SQLite, plus a matching configurations.json and
+exports/<jurisdiction>_status_*.csv files, and optionally the export
+file log configurations and archive for exportlog.py. Also holds the
+SQLite dialect of the query templates, so Feeds can run against it.
+
+    python -m benchmarks.synthetic --directory bench_data --vendors 10000 --log-rows 50000000 --archive'''
+
+FEED_TYPES = ['Positions', 'Transactions', 'Balances', 'ZIP', 'Reference']
+JURISDICTIONS = ['3ec4', '52fb']
+BATCH_SIZE = 100_000
+
+SCHEMA = '''
+    CREATE TABLE vendors (id INTEGER PRIMARY KEY, name TEXT, number INTEGER);
+    CREATE TABLE crm (id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE feed_config (id INTEGER PRIMARY KEY, vendor_id INTEGER, crm_id INTEGER);
+    CREATE TABLE feed_types (id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE file_config (id INTEGER PRIMARY KEY, config_id INTEGER, type_id INTEGER, mask TEXT);
+    CREATE TABLE process_log (
+        id INTEGER PRIMARY KEY,
+        feed_id INTEGER,
+        FileName TEXT,
+        download TIMESTAMP,
+        archive_time TIMESTAMP,
+        start TIMESTAMP,
+        "end" TIMESTAMP
+    );
+'''
+INDEXES = '''
+    CREATE INDEX ix_vendors_name ON vendors (name);
+    CREATE INDEX ix_feed_config_vendor ON feed_config (vendor_id);
+    CREATE INDEX ix_file_config_config ON file_config (config_id);
+    CREATE INDEX ix_process_log_feed ON process_log (feed_id, download);
+    CREATE INDEX ix_process_log_download ON process_log (download);
+'''
+
+def _insert(conn: sqlite3.Connection, table: str, rows):
+    '''Insert rows (an iterable of tuples) in batches.'''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(row))})', batch)
+            batch = []
+    if batch:
+        conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(batch[0]))})', batch)
+
+def generate(
+    directory: str,
+    vendors: int=1000,
+    masks_per_vendor: int=3,
+    log_rows: int=1_000_000,
+    days: int=7,
+    now: datetime=None,
+    seed: int=0
+) -> dict:
+    '''Build the database, configurations.json and exports under
+    directory. Every vendor is expected every day. Returns the paths.'''
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    os.makedirs(f'{directory}/exports', exist_ok=True)
+    db = f'{directory}/vendors.db'
+    if os.path.exists(db):
+        os.remove(db)
+
+    names = [f'vendor{i:05d}' for i in range(1, vendors + 1)]
+    offsets = {i: rng.choice([0, 1]) for i in names}
+    masks = [
+        (i * masks_per_vendor + k + 1, i + 1, rng.randint(1, len(FEED_TYPES)), f'V{i + 1}F{k}_yyyymmdd')
+        for i in range(vendors) for k in range(masks_per_vendor)
+    ]
+
+    conn = sqlite3.connect(db)
+    conn.executescript(SCHEMA)
+    _insert(conn, 'vendors', ((i + 1, names[i], rng.randint(0, 4)) for i in range(vendors)))
+    _insert(conn, 'crm', ((i + 1, f'crm{i % 20}') for i in range(vendors)))
+    _insert(conn, 'feed_config', ((i + 1, i + 1, i + 1) for i in range(vendors)))
+    _insert(conn, 'feed_types', ((i + 1, v) for i, v in enumerate(FEED_TYPES)))
+    _insert(conn, 'file_config', masks)
+
+    fixed = {}                                         # (mask, date): mask with its date filled in.
+
+    def _log():
+        for i in range(log_rows):
+            feed_id, vendor_id, _, mask = masks[rng.randrange(len(masks))]
+            download = now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86_400))
+            date = (download - timedelta(days=offsets[names[vendor_id - 1]])).date()
+            if (mask, date) not in fixed:
+                fixed[mask, date] = filemask.fix(mask, filemask.date_masks(date))
+            start = download + timedelta(seconds=rng.randrange(1, 300))
+            end = start + timedelta(seconds=rng.randrange(1, 3_600))
+            yield (i + 1, feed_id, f'{fixed[mask, date]}_{i}.csv', *(j.isoformat(' ') for j in (download, end + timedelta(seconds=5), start, end)))
+    _insert(conn, 'process_log', _log())
+    conn.executescript(INDEXES)
+    conn.commit()
+    conn.close()
+
+    configs = {
+        'brokers': {
+            i: {
+                'jurisdiction': JURISDICTIONS[n % len(JURISDICTIONS)],
+                'name': f'ftp{n % 50}',
+                'offset': str(offsets[i]),
+                'schedule': '0'
+            } for n, i in enumerate(names)
+        },
+        'schedules': {
+            '0': [0, 1, 2, 3, 4, 5, 6]
+        }
+    }
+    with open(f'{directory}/configurations.json', 'w') as f:
+        json.dump(configs, f)
+
+    exports = {}
+    for j, jurisdiction in enumerate(JURISDICTIONS):
+        path = f'{directory}/exports/{jurisdiction}_status_{now.strftime("%Y%m%d %H%M%S")}.csv'
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(['Size', 'ID', 'VendorName', 'LastModifiedTime', 'Status', 'SentAs'])
+            for n, i in enumerate(names[j::len(JURISDICTIONS)]):
+                if rng.random() < 0.9:
+                    modified = now - timedelta(seconds=rng.randrange(3_600))
+                    writer.writerow([rng.randint(100, 100_000), f'{n:08x}', i, modified.strftime('%m/%d/%Y %I:%M:%S %p').lstrip('0'), 'Sent', f'{jurisdiction}_{i}.zip'])
+                else:
+                    writer.writerow(['', f'{n:08x}', i, '', 'Not Sent', ''])
+        exports[jurisdiction] = path
+
+    return {
+        'database': db,
+        'configurations': f'{directory}/configurations.json',
+        'exports': exports
+    }
+
+def generate_archive(
+    directory: str,
+    vendors: int=1000,
+    files_per_vendor: int=2,
+    now: datetime=None,
+    seed: int=0
+) -> dict:
+    '''Build an ExportFileLog/<jurisdiction>/Configurations.xml tree and
+    an archive/ directory of zips for exportlog.py, on top of the
+    database from generate(). Most vendors have zips from today; the
+    rest have none, or only zips from another day, of another FTP user
+    or from before midnight. Returns the paths.'''
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today, yesterday = now.strftime('%Y.%m.%d'), (now - timedelta(days=1)).strftime('%Y.%m.%d')
+    archive = f'{directory}/archive'
+    log = f'{directory}/ExportFileLog'
+    os.makedirs(archive, exist_ok=True)
+
+    def _zip(name: str, modified: datetime):
+        path = f'{archive}/{name}'
+        with open(path, 'wb') as f:
+            f.write(b'0' * rng.randint(1, 2048))
+        os.utime(path, (modified.timestamp(), modified.timestamp()))
+
+    for j, jurisdiction in enumerate(JURISDICTIONS):
+        ftp = f'ftp{j}'
+        ids = range(j + 1, vendors + 1, len(JURISDICTIONS))
+        os.makedirs(f'{log}/{jurisdiction}', exist_ok=True)
+        custodians = ''.join(f'\t\t<Custodian>vendor{i:05d}</Custodian>\n' for i in ids)
+        with open(f'{log}/{jurisdiction}/Configurations.xml', 'w') as f:
+            f.write(
+                '<?xml version="1.0"?>\n<configurations>\n'
+                f'\t<ExportFileString>\n\t\t<Name>{ftp}</Name>\n\t</ExportFileString>\n'
+                f'\t<Jurisdiction>\n\t\t<Name>{jurisdiction}</Name>\n\t</Jurisdiction>\n'
+                f'\t<VendorsInScope>\n{custodians}\t\t<Custodian>unknown{j}</Custodian>\n\t</VendorsInScope>\n'
+                '</configurations>'
+            )
+        for i in ids:
+            kind = rng.random()
+            modified = midnight + (now - midnight) * rng.random()
+            if kind < 0.8:
+                for k in range(rng.randint(1, files_per_vendor)):
+                    _zip(f'{ftp}_{today}_{i}_{now:%Y.%m.%d}_{k:06d}_PTCCData.zip', modified)
+            elif kind < 0.85:
+                _zip(f'{ftp}_{yesterday}_{i}_0_PTCCData.zip', modified - timedelta(days=1))
+            elif kind < 0.9:
+                _zip(f'ftp{j + len(JURISDICTIONS)}_{today}_{i}_0_PTCCData.zip', modified)
+            elif kind < 0.95:
+                _zip(f'{ftp}_{today}_{i}_0_PTCCData.zip', midnight - timedelta(minutes=5))
+        _zip(f'{ftp}_{today}_readme.txt', now)
+    return {
+        'configurations': log,
+        'archive': archive
+    }
+
+class Configs(queries.Configs):
+    table = 'tmp_configs'
+    columns = ('vendor_name', 'name', '"offset"')
+
+    def init_temp_table(self) -> str:
+        return '''
+            DROP TABLE IF EXISTS temp.tmp_configs;
+            CREATE TEMP TABLE tmp_configs (vendor_name TEXT, name TEXT, "offset" INTEGER);
+        '''
+
+    def query_template(self) -> str:
+        return '''
+            select
+                conf.vendor_name,
+                conf.name,
+                conf."offset",
+                v.number
+            from tmp_configs conf
+            join vendors v on conf.vendor_name = v.name
+        '''
+
+class Expected(queries.Expected):
+    table = 'tmp_expected'
+    columns = ('vendor_name', 'name', '"offset"', 'number', 'feed_type')
+
+    def init_temp_table(self) -> str:
+        return '''
+            DROP TABLE IF EXISTS temp.tmp_expected;
+            CREATE TEMP TABLE tmp_expected (vendor_name TEXT, name TEXT, "offset" INTEGER, number INTEGER, feed_type TEXT);
+        '''
+
+    def query_template(self) -> str:
+        return '''
+            select
+                v.name,
+                c.name,
+                fic.mask,
+                ft.name,
+                exp."offset",
+                exp.number,
+                exp.feed_type
+            from tmp_expected exp
+            join vendors v on exp.vendor_name = v.name
+            join feed_config fec on v.id = fec.vendor_id
+            join file_config fic on fec.id = fic.config_id
+            join feed_types ft on fic.type_id = ft.id
+            join crm c on fec.crm_id = c.id
+        '''
+
+class Filemask(queries.Filemask):
+    '''The CROSS APPLY (select top 1 ... order by download desc) as a
+    window function.'''
+    table = 'tmp_filemask'
+
+    def init_temp_table(self) -> str:
+        return '''
+            DROP TABLE IF EXISTS temp.tmp_filemask;
+            CREATE TEMP TABLE tmp_filemask (file_mask TEXT, vendor_name TEXT, name TEXT, number INTEGER, feed_type TEXT);
+        '''
+
+    def query_template(self) -> str:
+        return '''
+            select
+                file_mask,
+                number,
+                feed_type,
+                FileName,
+                file_type,
+                download as "download [TIMESTAMP]",
+                archive_time as "archive_time [TIMESTAMP]",
+                start as "start [TIMESTAMP]",
+                "end" as "end [TIMESTAMP]",
+                vendor_name,
+                crm_name
+            from (
+                select
+                    masks.file_mask,
+                    masks.number,
+                    masks.feed_type,
+                    log.FileName,
+                    ft.name as file_type,
+                    log.download,
+                    log.archive_time,
+                    log.start,
+                    log."end",
+                    v.name as vendor_name,
+                    c.name as crm_name,
+                    row_number() over (partition by masks.rowid order by log.download desc) as latest
+                from tmp_filemask masks
+                join vendors v on v.name = masks.vendor_name
+                join feed_config fec on fec.vendor_id = v.id
+                join file_config fic on fic.config_id = fec.id
+                join feed_types ft on fic.type_id = ft.id
+                join crm c on fec.id = c.id
+                join process_log log on log.feed_id = fic.id
+                where log.FileName like '%' || masks.file_mask || '%'
+            )
+            where latest = 1
+        '''
+
+class ProcessLog(queries.ProcessLog):
+    table = 'tmp_process_log_vendors'
+
+    def init_temp_table(self) -> str:
+        return '''
+            DROP TABLE IF EXISTS temp.tmp_process_log_vendors;
+            CREATE TEMP TABLE tmp_process_log_vendors (vendor_name TEXT);
+        '''
+
+    def query_template(self) -> str:
+        return '''
+            select
+                log.FileName,
+                ft.name,
+                log.download as "download [TIMESTAMP]",
+                log.archive_time as "archive_time [TIMESTAMP]",
+                log.start as "start [TIMESTAMP]",
+                log."end" as "end [TIMESTAMP]",
+                v.name,
+                c.name
+            from process_log log
+            join file_config fic on log.feed_id = fic.id
+            join feed_types ft on fic.type_id = ft.id
+            join feed_config fec on fic.config_id = fec.id
+            join vendors v on fec.vendor_id = v.id
+            join crm c on fec.id = c.id
+            join tmp_process_log_vendors vend on v.name = vend.vendor_name
+            where log.download >= date('now', 'localtime', '-{lookback_days} days')
+        '''.format(lookback_days=int(self.lookback_days)) + self._since_filter()
+
+    def _since_filter(self) -> str:
+        if self.since is None:
+            return ''
+        return '''
+                AND log.download > '{since}'
+        '''.format(since=self.since.isoformat(' '))
+
+class VendorIds(queries.VendorIds):
+    table = 'tmp_vendor_ids'
+
+    def init_temp_table(self) -> str:
+        return '''
+            DROP TABLE IF EXISTS temp.tmp_vendor_ids;
+            CREATE TEMP TABLE tmp_vendor_ids (vendor_name TEXT);
+        '''
+
+    def query_template(self) -> str:
+        return '''
+            select
+                v.id,
+                v.name
+            from tmp_vendor_ids vis
+            join vendors v on vis.vendor_name = v.name
+        '''
+
+def sqlite_templates() -> tuple:
+    '''SQLite templates, in the same order as setup.get_templates().'''
+    return Configs(), Expected(), Filemask(), ProcessLog(), VendorIds()
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Generate a synthetic vendor database, configurations and exports.')
+    parser.add_argument('--directory', default='bench_data')
+    parser.add_argument('--vendors', type=int, default=1000)
+    parser.add_argument('--masks-per-vendor', type=int, default=3)
+    parser.add_argument('--log-rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--archive', action='store_true', help='Also build the export file log and archive (see exportlog.py).')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(generate(args.directory, args.vendors, args.masks_per_vendor, args.log_rows, args.days, seed=args.seed))
+    if args.archive:
+        print(generate_archive(args.directory, args.vendors, seed=args.seed))
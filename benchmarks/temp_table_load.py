@@ -0,0 +1,44 @@
+from queries import Filemask
+import setup
+from time import perf_counter
+
+'''Compare loading the #filemask temp table with concatenated INSERT
+statements against bulk loading the rows as parameter arrays.'''
+
+SIZES = [100, 10_000, 100_000]
+
+def synthetic_masks(n: int) -> dict:
+    '''Build n expected filemasks, in the same shape as
+    df.expected_converter().'''
+    return {
+        i: {
+            'Mask': f'{i:08x}_20210528',
+            'Vendor': f'vendor {i % 5000}',
+            'Name': f'crm {i % 50}',
+            'VendorNumber': i % 4,
+            'FeedType': 'Direct'
+        } for i in range(n)
+    }
+
+def time_load(conn, masks: dict, bulk: bool) -> float:
+    '''Time initializing and loading the temp table.'''
+    template = Filemask()
+    start = perf_counter()
+    conn._execute(template.init_temp_table())
+    if bulk:
+        conn._execute_many(template.insert_statement(), template.rows(masks))
+    else:
+        conn._execute(template.insert_values(masks))
+    return perf_counter() - start
+
+def main():
+    print(f'{"rows":>8} {"strings (s)":>12} {"bulk (s)":>10}')
+    with setup.POOL.connection() as conn:
+        for n in SIZES:
+            masks = synthetic_masks(n)
+            strings = time_load(conn, masks, bulk=False)
+            bulk = time_load(conn, masks, bulk=True)
+            print(f'{n:>8} {strings:>12.3f} {bulk:>10.3f}')
+
+if __name__ == '__main__':
+    main()
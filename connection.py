@@ -1,4 +1,15 @@
-import pyodbc
+from contextlib import contextmanager
+from datetime import datetime
+from queue import Empty, LifoQueue
+import sqlite3
+from threading import Lock
+
+try:
+    import pyodbc
+    DATABASE_ERRORS = (pyodbc.Error, sqlite3.Error)
+except ImportError:                                    # Only SQLiteConnection is usable without pyodbc.
+    pyodbc = None
+    DATABASE_ERRORS = (sqlite3.Error,)
 
 '''Module to interact with any databases.'''
 
@@ -40,20 +51,71 @@ class BaseConnection:
         self._close()
         return self._open()
 
+    def _drain(self):
+        '''Skip past any remaining result sets so the cursor can be
+        reused for the next statement.'''
+        while self._cursor.nextset():
+            pass
+
     def _execute(self, query):
         '''Execute a given query. Used for building temp tables and
         adding data to them. In this case, we don't care about the
         results of the query.'''
         self._cursor.execute(query)
-        self._cursor = self._new_cursor()
+        self._drain()
+
+    def is_healthy(self) -> bool:
+        '''Cheap round-trip to check the connection is still usable.'''
+        try:
+            self._cursor.execute('SELECT 1')
+            self._cursor.fetchall()
+            return True
+        except DATABASE_ERRORS:
+            return False
+
+    def close(self):
+        '''Close the cursor and the underlying connection.'''
+        try:
+            self._close()
+            self._connection.close()
+        except DATABASE_ERRORS:
+            pass
+
+    def _execute_many(self, query, rows):
+        '''Execute a parameterized query for every row in rows. Rows are
+        sent to the server as parameter arrays (fast_executemany), so
+        large temp table loads are one round-trip instead of one
+        statement per row.'''
+        if rows:
+            self._cursor.fast_executemany = True
+            self._cursor.executemany(query, rows)
+            self._drain()
 
     def _execute_select_all(self, query):
         '''Execute a query and return all results from the query.'''
         self._cursor.execute(query)
         results = self._cursor.fetchall()
-        self._cursor = self._new_cursor()
+        self._drain()
         return results
 
+    def _execute_select_batches(self, query, size: int=10000):
+        '''Execute a query and yield its results in batches of size rows,
+        so large results can be consumed without holding them all.'''
+        self._cursor.execute(query)
+        while True:
+            rows = self._cursor.fetchmany(size)
+            if not rows:
+                break
+            yield rows
+        self._drain()
+
+    def _execute_select_columns(self, query, size: int=10000):
+        '''Like _execute_select_batches, but yield each batch as a tuple
+        of column tuples, ready to be turned into typed (e.g. Arrow)
+        arrays. Only one batch of rows is held at a time.'''
+        for rows in self._execute_select_batches(query, size):
+            yield tuple(zip(*rows))
+
 class Connection(BaseConnection):
     '''Create a database connection using default production values.'''
     def __init__(
@@ -64,4 +126,135 @@ class Connection(BaseConnection):
         super().__init__(
             server,
             database
-        )
\ No newline at end of file
+        )
+
+class SQLiteConnection(BaseConnection):
+    '''Connection to a local SQLite database, used as a stand-in for the
+    production database (see benchmarks/synthetic.py). Columns selected
+    as "name [TIMESTAMP]" come back as datetimes, and datetime
+    parameters are sent as ISO strings. Both conversions are done by this
+    connection, not by sqlite3's process-wide adapters and converters.
+    Statements autocommit, so an idle pooled connection holds no lock
+    on the database file.'''
+    def __init__(
+        self,
+        path: str
+    ):
+        self._path = path
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.row_factory = self._convert_row
+        self._description = None
+        self._timestamps = []
+        self._cursor = self._open()
+
+    def _convert_row(self, cursor, row: tuple) -> tuple:
+        '''Parse the [TIMESTAMP] columns of a result row.'''
+        if cursor.description is not self._description:
+            self._description = cursor.description
+            self._timestamps = [i for i, v in enumerate(cursor.description or ()) if v[0].endswith('[TIMESTAMP]')]
+        if not self._timestamps:
+            return row
+        row = list(row)
+        for i in self._timestamps:
+            if row[i] is not None:
+                row[i] = datetime.fromisoformat(row[i])
+        return tuple(row)
+
+    def _drain(self):
+        '''SQLite cursors have a single result set.'''
+        pass
+
+    def _execute(self, query):
+        '''Execute one or more statements.'''
+        self._cursor.executescript(query)
+
+    def _execute_many(self, query, rows):
+        if rows:
+            self._cursor.executemany(query, [
+                tuple(v.isoformat(' ') if isinstance(v, datetime) else v for v in row) for row in rows
+            ])
+
+class ConnectionPool:
+    '''Fixed-size pool of connections. Connections are opened lazily,
+    checked for health when borrowed, and keep their cursor between
+    statements so pyodbc can reuse prepared statements.'''
+    def __init__(
+        self,
+        size: int=4,
+        timeout: float=None,
+        health_check: bool=True,
+        factory=Connection,
+        **kwargs
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.health_check = health_check
+        self._factory = factory
+        self._kwargs = kwargs
+        self._idle = LifoQueue(maxsize=size)
+        self._lock = Lock()
+        self._created = 0
+
+    def _create(self):
+        '''Open a new connection, if the pool has room for one.'''
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return self._factory(**self._kwargs)
+        except Exception:
+            self._discard()
+            raise
+
+    def _discard(self, conn=None):
+        '''Drop a connection from the pool, freeing its slot.'''
+        if conn is not None:
+            conn.close()
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        '''Borrow a connection. Prefer an idle one, otherwise open a new
+        one, otherwise wait for one to be released.'''
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                conn = self._create()
+                if conn is None:
+                    try:
+                        conn = self._idle.get(timeout=self.timeout)
+                    except Empty:
+                        raise TimeoutError(f'No connection available after {self.timeout}s.')
+            if not self.health_check or conn.is_healthy():
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        '''Return a borrowed connection to the pool.'''
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        '''Borrow a connection for the duration of a with block.'''
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except DATABASE_ERRORS:
+            broken = True
+            raise
+        finally:
+            if broken:
+                self._discard(conn)
+            else:
+                self.release(conn)
+
+    def close(self):
+        '''Close every idle connection.'''
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except Empty:
+                break
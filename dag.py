@@ -0,0 +1,73 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+'''Module to run a small dependency graph of stages on a thread pool.
+Each stage is a function of its dependencies' results; stages start as
+soon as their dependencies finish, so independent stages overlap and
+the wall time is the longest chain of stages (the critical path)
+rather than the sum of all of them.'''
+
+Stages = Dict[str, Tuple[Callable, Tuple[str, ...]]]     # Name: (function, dependency names).
+
+def _check(stages: Stages):
+    '''Raise ValueError on unknown dependencies or cycles.'''
+    for name, (_, deps) in stages.items():
+        unknown = [i for i in deps if i not in stages]
+        if unknown:
+            raise ValueError(f'Stage {name} depends on unknown stages {unknown}.')
+    done = set()
+    while len(done) < len(stages):
+        ready = [i for i in stages if i not in done and all(j in done for j in stages[i][1])]
+        if not ready:
+            raise ValueError(f'Stages {sorted(set(stages) - done)} have circular dependencies.')
+        done.update(ready)
+
+def run(stages: Stages, workers: int=None) -> Tuple[dict, dict]:
+    '''Run the stages, each with its dependencies' results as positional
+    arguments (in the order listed). Returns ({name: result},
+    {name: (start, end)}), with times in seconds from the start of the
+    run. The first failing stage's exception is raised once the running
+    stages finish; stages that haven't started are skipped.'''
+    _check(stages)
+    results, timings = {}, {}
+    origin = perf_counter()
+
+    def _stage(name: str):
+        func, deps = stages[name]
+        start = perf_counter() - origin
+        result = func(*(results[i] for i in deps))
+        timings[name] = (start, perf_counter() - origin)
+        return result
+
+    pending = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers or len(stages)) as executor:
+        while pending or running:
+            for name in [i for i in pending if all(j in results for j in pending[i][1])]:
+                running[executor.submit(_stage, name)] = name
+                del pending[name]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    wait(running)
+                    raise error
+                results[name] = future.result()
+    return results, timings
+
+def critical_path(stages: Stages, timings: dict) -> Tuple[List[str], float]:
+    '''The chain of dependent stages with the largest total duration, and
+    that duration.'''
+    longest = {}                                       # Name: (chain seconds, chain).
+
+    def _longest(name: str) -> Tuple[float, List[str]]:
+        if name not in longest:
+            seconds = timings[name][1] - timings[name][0]
+            before = max((_longest(i) for i in stages[name][1]), default=(0.0, []))
+            longest[name] = (before[0] + seconds, before[1] + [name])
+        return longest[name]
+
+    seconds, path = max((_longest(i) for i in stages), default=(0.0, []))
+    return path, seconds
@@ -1,17 +1,37 @@
+from df import add_duration
 from df import apply_feed_type
 from df import build_export_df
+from df import concat_frames
 from df import configs_to_dict
 from df import DataFrame
 from df import df_from_sql
 from df import filter_data
 from df import get_feed_type
 from df import group_and_consolidate
+from df import latest_watermark
+from df import merge_newer
+from df import replace_exported
+from df import shard_by_vendor
 from df import to_datetime
-from setup import CONN
-from setup import CONFIGS
-from setup import QUERIES
-from setup import TEMPLATES
+from df import vendor_index
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+import dag
+import exportlog
+from matcher import match_latest
+import metrics
+import schema
+import setup
+import snapshot
+from setup import ACTUAL_ENGINE
+from setup import BUILD_WORKERS
+from setup import datetime
+from setup import EXPORT_SOURCE
+from setup import FETCH_BATCH_SIZE
+from setup import MATCH_DOP
+from setup import SNAPSHOT_TTL
 from setup import Tuple
+from time import perf_counter
 
 '''Module to get expected files to be processed, actual files processed,
 and all export files sent. Prepare and filter the data accordingly.'''
@@ -21,20 +41,155 @@ class Feeds:
     actually processed data, exported data, and all data (exported and
     condensed processed data merged together).'''
     def __init__(
-        self
+        self,
+        engine: str=ACTUAL_ENGINE,
+        now: datetime=None
     ):
-        self.configs = self.Configs().configs
-        self.expected = self.Expected(self.configs).expected
-        self.actual = self.Actual(self.expected).actual
+        start = perf_counter()
+        self.now = now or datetime.now()                   # Reference timestamp for the whole build.
+        self.engine = engine
+        self.config_version = setup.CONFIG_REGISTRY.version  # Version of configurations.json the build used.
+        built = self._build(engine)
+        self.configs = built['configs']
+        self.expected = built['expected']
+        self.actual = built['actual']
         self.all_actuals = self.actual[0]
         self.condensed_actuals = self.actual[1]
-        self.exported = self.Exported().exported
+        self.watermark = built['watermark']
+        self.vendors = built['vendors']                    # Vendor -> row positions in all_actuals.
+        self.exported = built['exported']
         self.feeds = self._get_feeds()
+        self.refreshed_at = datetime.now()
+        self.build_seconds = perf_counter() - start        # Reported as the last refresh duration.
+        metrics.STAGE_SECONDS.observe(self.build_seconds, stage='build')
+
+    def _build(self, engine: str) -> dict:
+        '''Build the frames as a dependency graph (see dag.py). Exported
+        is a file read, so it overlaps the database chain (Configs ->
+        Expected -> Actual), and each stage takes its own pooled
+        connection. The stage timings and the critical path are kept
+        in stage_timings and critical_path.'''
+        stages = {
+            'configs': (lambda: self.Configs(self.now).configs, ()),
+            'expected': (lambda configs: self.Expected(configs, self.now).expected, ('configs',)),
+            'actual': (lambda expected: self.Actual(expected, engine).actual, ('expected',)),
+            'watermark': (lambda actual: latest_watermark(actual[0]), ('actual',)),
+            'vendors': (lambda actual: vendor_index(actual[0]), ('actual',)),
+            'exported': (lambda: self.Exported().exported, ())
+        }
+        built, self.stage_timings = dag.run(stages, BUILD_WORKERS)
+        self.critical_path, seconds = dag.critical_path(stages, self.stage_timings)
+        metrics.CRITICAL_PATH_SECONDS.set(seconds)
+        return built
+
+    def refresh(self) -> 'Feeds':
+        '''Return a new snapshot with the process log rows downloaded
+        after the watermark merged into all_actuals and
+        condensed_actuals. The current snapshot is left untouched, so
+        readers can keep using it until the new one is swapped in.'''
+        start = perf_counter()
+        newer = self.Actual(self.expected, 'client', self.watermark).actual[0]
+        feeds = copy(self)
+        feeds.all_actuals = merge_newer(self.all_actuals, newer, self.Actual.match_keys)
+        feeds.condensed_actuals = group_and_consolidate(feeds.all_actuals, self.Actual.keys)
+        feeds.actual = (feeds.all_actuals, feeds.condensed_actuals)
+        feeds.watermark = latest_watermark(feeds.all_actuals) or self.watermark
+        feeds.vendors = vendor_index(feeds.all_actuals)
+        feeds.feeds = feeds._get_feeds()
+        feeds.refreshed_at = datetime.now()
+        feeds.build_seconds = perf_counter() - start
+        metrics.STAGE_SECONDS.observe(feeds.build_seconds, stage='refresh')
+        return feeds
+
+    def reconfigure(self) -> 'Feeds':
+        '''Return a new snapshot for the current configurations file,
+        re-running only Configs and Expected. Actual rows of masks that
+        are still expected are kept; only newly expected masks are
+        matched against the process log.'''
+        start = perf_counter()
+        feeds = copy(self)
+        feeds.config_version = setup.CONFIG_REGISTRY.version
+        feeds.configs = self.Configs(self.now).configs
+        feeds.expected = self.Expected(feeds.configs, self.now).expected
+        masks = feeds.expected.set_index(['FixedFileMask', 'Vendor']).index
+        known = self.expected.set_index(['FixedFileMask', 'Vendor']).index
+        kept = self.all_actuals[self.all_actuals.set_index(self.Actual.match_keys).index.isin(masks)]
+        added = feeds.expected[~masks.isin(known)]
+        if len(added):
+            newer = self.Actual(added, getattr(self, 'engine', ACTUAL_ENGINE)).actual[0]
+            kept = merge_newer(kept, newer, self.Actual.match_keys)
+        feeds.all_actuals = kept.reset_index(drop=True)
+        feeds.condensed_actuals = group_and_consolidate(feeds.all_actuals, self.Actual.keys)
+        feeds.actual = (feeds.all_actuals, feeds.condensed_actuals)
+        feeds.watermark = latest_watermark(feeds.all_actuals) or self.watermark
+        feeds.vendors = vendor_index(feeds.all_actuals)
+        feeds.feeds = feeds._get_feeds()
+        feeds.refreshed_at = datetime.now()
+        feeds.build_seconds = perf_counter() - start
+        metrics.STAGE_SECONDS.observe(feeds.build_seconds, stage='reconfigure')
+        return feeds
+
+    def vendor_rows(self, vendor: str) -> DataFrame:
+        '''A vendor's rows of all_actuals, looked up in the index.'''
+        positions = self.vendors.get(vendor)
+        if positions is None:
+            return self.all_actuals.iloc[0:0]
+        return self.all_actuals.iloc[positions]
+
+    def update_exported(self, paths: dict=None, frames: dict=None) -> 'Feeds':
+        '''Return a new snapshot with the export status of the given
+        jurisdictions ({jurisdiction: path}) re-read from their latest
+        files, and feeds re-merged. Other jurisdictions are kept. With
+        frames (a whole archive scan, see exportlog.scan), the export
+        status is replaced by the scan instead.'''
+        start = perf_counter()
+        exported = self.Exported(paths, frames=frames).exported
+        if frames is None:
+            jurisdictions = list(paths)
+        else:
+            jurisdictions = list(set(self.exported['Name'].dropna()) | set(frames))
+        feeds = copy(self)
+        feeds.exported = replace_exported(self.exported, exported, jurisdictions)
+        feeds.feeds = feeds._get_feeds()
+        feeds.refreshed_at = datetime.now()
+        feeds.build_seconds = perf_counter() - start
+        metrics.STAGE_SECONDS.observe(feeds.build_seconds, stage='update_exported')
+        return feeds
+
+    def save(self) -> str:
+        '''Persist the frames as an on-disk snapshot (see snapshot.py).'''
+        return snapshot.save(
+            {i: getattr(self, i) for i in snapshot.FRAMES},
+            {i: getattr(self, i, None) for i in snapshot.ATTRIBUTES}
+        )
+
+    @classmethod
+    def from_snapshot(cls, saved: dict) -> 'Feeds':
+        '''Build Feeds from loaded snapshot frames, without querying.'''
+        feeds = cls.__new__(cls)
+        for i in saved['frames']:
+            setattr(feeds, i, saved['frames'][i])
+        for i in saved['attributes']:
+            setattr(feeds, i, saved['attributes'][i])
+        feeds.actual = (feeds.all_actuals, feeds.condensed_actuals)
+        feeds.vendors = vendor_index(feeds.all_actuals)
+        return feeds
+
+    @classmethod
+    def cached(cls, ttl: float=SNAPSHOT_TTL) -> 'Feeds':
+        '''Load the newest snapshot if it is younger than ttl seconds.
+        Otherwise build Feeds from the database and save a snapshot.'''
+        saved = snapshot.load(ttl=ttl)
+        if saved is not None:
+            return cls.from_snapshot(saved)
+        feeds = cls()
+        feeds.save()
+        return feeds
 
     def _cleanup(self, df: DataFrame) -> DataFrame:
         df = df[[
             'Status',
-            'ProcessorName',
+            'VendorName',
             'VendorNumber',
             'FeedType',
             'Name_x',
@@ -60,6 +215,7 @@ class Feeds:
         ]
         return df
 
+    @metrics.STAGE_SECONDS.time(stage='get_feeds')
     def _get_feeds(self) -> DataFrame:
         '''Get the latest feed file status by merging the actually
         exported data and the condensed actually processed data.'''     
@@ -71,19 +227,25 @@ class Feeds:
         )
         feeds = apply_feed_type(feeds, self.configs)
         feeds = self._cleanup(feeds)
-        return feeds
+        return schema.apply(feeds, 'feeds')
 
     class Configs:
+        '''Configurations of the vendors expected on now's weekday (see
+        registry.py).'''
         def __init__(
-            self
+            self,
+            now: datetime=None
         ):
-            self.configs = self._get_configs()
+            self.configs = self._get_configs(now)
 
-        def _get_configs(self):
+        @metrics.STAGE_SECONDS.time(stage='configs')
+        def _get_configs(self, now: datetime=None):
             '''Load the configurations data into a DataFrame, for
             reference later.'''
-            configs = QUERIES.execute_sql(CONN, CONFIGS, TEMPLATES[0])
-            df = df_from_sql('configs', configs)
+            vendors = setup.CONFIG_REGISTRY.expected(now)
+            with setup.POOL.connection() as conn:
+                configs = setup.QUERIES.stream_columns(conn, vendors, setup.TEMPLATES[0], FETCH_BATCH_SIZE)
+                df = df_from_sql('configs', configs)
             return df
 
     class Expected:
@@ -92,52 +254,123 @@ class Feeds:
         file.'''
         def __init__(
             self,
-            configs
+            configs,
+            now: datetime=None
         ):
-            self.expected = self._get_expected(configs)
+            self.expected = self._get_expected(configs, now)
 
-        def _get_expected(self, configs) -> DataFrame:
-            '''Get expected Vendor feed filenames and fix the filenames.'''
-            expected = QUERIES.execute_sql(CONN, configs_to_dict('configs', configs), TEMPLATES[1])
-            df = df_from_sql('expected', expected)
+        @metrics.STAGE_SECONDS.time(stage='expected')
+        def _get_expected(self, configs, now: datetime=None) -> DataFrame:
+            '''Get expected Vendor feed filenames and fix the filenames
+            relative to now.'''
+            with setup.POOL.connection() as conn:
+                expected = setup.QUERIES.stream_columns(conn, configs_to_dict('configs', configs), setup.TEMPLATES[1], FETCH_BATCH_SIZE)
+                df = df_from_sql('expected', expected, now)
             return df
 
     class Actual:
-        '''Build the "actually processed" DataFrame.'''
+        '''Build the "actually processed" DataFrame. If since is given,
+        only process log rows downloaded after it are matched. With dop
+        above 1, the 'sql' engine runs that many vendor-balanced shards
+        of the filemasks on separate connections in parallel.'''
+        date_cols = {'Download', 'Start', 'End'}               # Date columns that we will aggregate on later.
+        keys = ['VendorName', 'Name']                          # Keys for aggregation.
+        match_keys = ['FileMask', 'VendorName']                # One (latest) match per mask and vendor.
+
         def __init__(
             self,
-            expected
+            expected,
+            engine: str=ACTUAL_ENGINE,
+            since: datetime=None,
+            dop: int=MATCH_DOP
         ):
-            self._date_cols = {'Download', 'Start', 'End'}     # Date columns that we will aggregate on later.
-            self._keys = ['VendorName', 'Name']                # Keys for aggregation.
+            self._engine = engine
+            self._since = since
+            self._dop = dop
             self.actual = self._get_actual(expected)
 
         def _cleanup(self, df: DataFrame)-> Tuple[DataFrame, DataFrame]:
             df = filter_data(df)
-            df = to_datetime(df, self._date_cols)
-            consolidated = group_and_consolidate(df, self._keys, self._date_cols)
+            df = to_datetime(df, self.date_cols)
+            df = add_duration(df)
+            consolidated = group_and_consolidate(df, self.keys)
             return df, consolidated
 
+        def _match_sql(self, filemask: dict) -> DataFrame:
+            '''Match filemasks on the server, one CROSS APPLY per mask.
+            The results are streamed into columns batch by batch.'''
+            if self._dop > 1:
+                return self._match_sharded(filemask)
+            with setup.POOL.connection() as conn:
+                return df_from_sql('actual', setup.QUERIES.stream_columns(conn, filemask, setup.TEMPLATES[2], FETCH_BATCH_SIZE))
+
+        def _match_sharded(self, filemask: dict) -> DataFrame:
+            '''Run the CROSS APPLY for each vendor shard on its own pooled
+            connection (temp tables are per session, so the shards don't
+            collide), and concatenate the results in the order of the
+            filemasks, as the single-shot query returns them.'''
+            def _shard(shard: dict) -> DataFrame:
+                with setup.POOL.connection() as conn:
+                    return df_from_sql('actual', setup.QUERIES.stream_columns(conn, shard, setup.TEMPLATES[2], FETCH_BATCH_SIZE))
+
+            shards = shard_by_vendor(filemask, self._dop)
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                df = concat_frames('actual', list(executor.map(_shard, shards)))
+            order = {}
+            for n, i in enumerate(filemask):
+                order.setdefault((filemask[i]['Mask'], filemask[i]['Vendor']), n)
+            keys = zip(df['FileMask'].astype(object), df['VendorName'].astype(object))
+            positions = [order.get(i, len(order)) for i in keys]
+            return df.iloc[sorted(range(len(df)), key=positions.__getitem__)].reset_index(drop=True)
+
+        def _match_client(self, filemask: dict) -> DataFrame:
+            '''Stream the recent process log once and match every mask
+            against it on the client.'''
+            template = type(setup.TEMPLATES[3])(since=self._since) if self._since else setup.TEMPLATES[3]
+            with setup.POOL.connection() as conn:
+                batches = setup.QUERIES.stream_sql(conn, filemask, template, FETCH_BATCH_SIZE)
+                return df_from_sql('actual', match_latest(filemask, (row for batch in batches for row in batch)))
+
+        @metrics.STAGE_SECONDS.time(stage='actual')
         def _get_actual(self, expected: DataFrame) -> Tuple[DataFrame, DataFrame]:
             '''Get the actually processed Vendor feed data, and split it
             into a "raw" DataFrame of all results and a "consolidated"
             DataFrame of "aggregated" values.'''
-            actual = QUERIES.execute_sql(CONN, configs_to_dict('expected', expected), TEMPLATES[2])
-            df = df_from_sql('actual', actual)
+            filemask = configs_to_dict('expected', expected)
+            engines = {
+                'sql': self._match_sql,
+                'client': self._match_client
+            }
+            engine = 'client' if self._since else self._engine
+            with metrics.STAGE_SECONDS.time(stage=f'match_{engine}'):
+                df = engines[engine](filemask)
             dfs = self._cleanup(df)
             return dfs
 
     class Exported:
         '''Actually sent files. Comes from an external file generated on
-        the server.'''
+        the server. Reads the latest file per jurisdiction, or only the
+        given {jurisdiction: path} files. With source 'scan', the
+        archive is scanned directly instead (see exportlog.py), or the
+        given frames of a scan are used.'''
         def __init__(
-            self
+            self,
+            paths: dict=None,
+            source: str=EXPORT_SOURCE,
+            frames: dict=None
         ):
-            self.exported = self._get_exported()
+            self._source = source
+            self.exported = self._get_exported(paths, frames)
 
-        def _get_exported(self) -> DataFrame:
+        @metrics.STAGE_SECONDS.time(stage='exported')
+        def _get_exported(self, paths: dict=None, frames: dict=None) -> DataFrame:
             '''Read the file from an external csv.'''
-            df = build_export_df()
+            if frames is not None:
+                df = build_export_df(frames=frames)
+            elif paths is None and self._source == 'scan':
+                df = build_export_df(frames=exportlog.scan())
+            else:
+                df = build_export_df(paths)
             df = df[[
                 'VendorName',
                 'Name',
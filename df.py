@@ -1,81 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
 import filemask
-from glob import glob
+from functools import partial
+import metrics
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
+from setup import AGGREGATIONS
+from setup import datetime
 from setup import FILETYPES_TO_IGNORE
-from setup import os
 from setup import THIRD_PARTY
-from setup import THIS_DIR
-from typing import Callable, List, Set
+import re
+import schema
+from typing import Dict, List, Set, Tuple
+from watcher import latest_exports
 
 '''Module containing methods to interact with and transform DataFrame
 objects, for both export files sent, expected files to be proecssed,
 and actual files processed.'''
 
+PERCENTILE = re.compile(r'p\d{1,2}')
+
 def df_columns(kind: str) -> list:
-    '''Columns for different types of DataFrames to be created.'''
-    cols = {
-        'configs': [
-            'Vendor',
-            'Name',
-            'Offset',
-            'VendorNumber'
-        ],
-        'expected': [
-            'Vendor',
-            'Name',
-            'FileMask',
-            'FileType',
-            'Offset',
-            'VendorNumber',
-            'FeedType'
-        ],
-        'actual': [
-            'FileMask',
-            'VendorNumber',
-            'FeedType',
-            'FileName',
-            'FileType',
-            'Download',
-            'Archive',
-            'Start',
-            'End', 
-            'Vendor',
-            'Name'
-        ]
-    }
-    return cols[kind]
+    '''Columns for different types of DataFrames to be created (see
+    schema.py).'''
+    return schema.columns(kind)
 
 def get_feed_type(df: DataFrame) -> DataFrame:
     '''Using the map function, get the "feed delivery type" from the broker
     number (brokers that use third party clearing firms all have the same
     broker number).'''
-    df['FeedType'] = df['VendorNumber'].map(THIRD_PARTY).fillna('Direct')
+    df['FeedType'] = df['VendorNumber'].map(THIRD_PARTY).fillna('Direct').astype(schema.CATEGORY)
     return df
 
-def fix_file_mask(df: DataFrame) -> DataFrame:
-    '''Using the apply function, fix all filemasks using the database
-    configuration and offset value.'''
-    df['FixedFileMask'] = df.apply(lambda x: filemask.Filemask(x['FileMask'], x['Offset']).mask, axis=1)
+@metrics.STAGE_SECONDS.time(stage='fix_file_mask')
+def fix_file_mask(df: DataFrame, now: datetime=None) -> DataFrame:
+    '''Fix all filemasks using the database configuration and offset
+    value. Each distinct (mask, offset) pair is fixed once: the date
+    components are computed once per offset and replaced with vectorized
+    string operations, then mapped back onto every row. The whole batch
+    uses one reference timestamp (default: now).'''
+    now = now or datetime.now()
+    keys = DataFrame({
+        'FileMask': df['FileMask'].astype(str),
+        'Offset': df['Offset'].astype(int)
+    })
+    unique = keys.drop_duplicates()
+    fixed = []
+
+    for offset, group in unique.groupby('Offset'):
+        dates = filemask.date_masks(filemask.offset_date(offset, now))
+        masks = group['FileMask']
+        for i in dates:
+            masks = masks.str.replace(i, dates[i], regex=False)
+        fixed.append(group.assign(FixedFileMask=masks.str.replace('{}]', '', regex=False)))
+
+    if fixed:
+        unique = pd.concat(fixed)
+    else:
+        unique = unique.assign(FixedFileMask=unique['FileMask'])
+    df['FixedFileMask'] = keys.merge(unique, on=['FileMask', 'Offset'], how='left')['FixedFileMask'].values
     return df
 
-def apply_mapping(kind: str, df: DataFrame) -> DataFrame:
+def apply_mapping(kind: str, df: DataFrame, now: datetime=None) -> DataFrame:
     '''Determine using mapper dict and apply the applicable changes
     to the DataFrame.'''
     mapper = {
         'configs': get_feed_type,
-        'expected': fix_file_mask
+        'expected': partial(fix_file_mask, now=now)
     }
     if mapper.get(kind): df = mapper[kind](df)
     return df
 
-def df_from_sql(kind: str, results: list) -> DataFrame:
+def df_from_sql(kind: str, results, now: datetime=None) -> DataFrame:
     '''Create DataFrame from results of: connection.BaseConnection._execute_select_all()
+    (a list of rows), or from batches of columns streamed by
+    queries.Queries.stream_columns(), which are converted to Arrow as
+    they arrive so large pulls use bounded memory.
     If we are looking for expected files, also fix the filemask to the
-    preceeding date.'''
-    df = DataFrame([list(i) for i in results], columns=df_columns(kind))
-    df = apply_mapping(kind, df)
+    preceeding date (relative to now, if given). Columns are built
+    directly in their schema dtypes.'''
+    if isinstance(results, list):
+        df = schema.from_rows(kind, results)
+    else:
+        df = schema.from_columns(kind, results)
+    df = apply_mapping(kind, df, now)
     return df
 
 def config_converter(df: DataFrame) -> List[List[str]]:
@@ -125,110 +133,163 @@ def configs_to_dict(kind: str, df: DataFrame) -> List[List[str]]:
     }
     return mapper[kind](df)
 
-def get_export_path(filemask: str) -> str:
-    '''Locate the latest file for a given jurisdiction's filemask pattern.'''
-    return sorted(glob(f'{THIS_DIR}/exports/{filemask}'), key=os.path.getmtime, reverse=True)[0] 
+def concat_frames(kind: str, dfs: List[DataFrame]) -> DataFrame:
+    '''Concatenate frames of the same kind, keeping the schema dtypes
+    (categoricals with different categories would become object).'''
+    if not dfs:
+        return schema.empty(kind)
+    return schema.apply(pd.concat(dfs, ignore_index=True), kind)
 
-def export_jurisdictions() -> dict:
-    '''Current jurisdictions and their wildcard filemasks. New
-    jursidictions can be added here. The jurisdiction is also the
-    company's name.'''
-    return {
-        '3ec4': '3ec4_status_*.csv',
-        '52fb': '52fb_status_*.csv'
-    }
+def shard_by_vendor(filemask: dict, shards: int) -> List[dict]:
+    '''Split converted expected filemasks into at most shards dicts of
+    whole vendors, balanced by mask count: the biggest vendors go first,
+    each to the least loaded shard. Keys keep their order within a
+    shard.'''
+    vendors = {}
+    for i in filemask:
+        vendors.setdefault(filemask[i]['Vendor'], []).append(i)
+    loads = [[0, []] for _ in range(max(1, min(shards, len(vendors))))]
+    for keys in sorted(vendors.values(), key=len, reverse=True):
+        shard = min(loads, key=lambda i: i[0])
+        shard[0] += len(keys)
+        shard[1].extend(keys)
+    order = {v: i for i, v in enumerate(filemask)}
+    return [{i: filemask[i] for i in sorted(keys, key=order.get)} for _, keys in loads if keys]
+
+def export_dtypes() -> dict:
+    '''Explicit dtypes for the export status CSVs written by
+    BuildExportFileLog.ps1. LastModifiedTime is parsed separately.'''
+    return schema.dtypes('export_file')
+
+def empty_export_df() -> DataFrame:
+    '''Empty, typed DataFrame with the export columns.'''
+    return schema.empty('exported')
+
+@metrics.STAGE_SECONDS.time(stage='read_export')
+def read_export_file(path: str, jurisdiction: str) -> DataFrame:
+    '''Read one export status CSV with the explicit schema, using the
+    pyarrow parser. Returns an empty typed frame if there is no file.'''
+    if path is None:
+        return empty_export_df()
+    df = pd.read_csv(path, engine='pyarrow', dtype=export_dtypes())
+    df['LastModifiedTime'] = pd.to_datetime(df['LastModifiedTime'], format='%m/%d/%Y %I:%M:%S %p')
+    df = df.rename(columns={'LastModifiedTime': 'Modified'})
+    df['Name'] = pd.Series(jurisdiction, index=df.index, dtype=schema.CATEGORY) # The jurisdiction is also the company's name.
+    return df
+
+def build_export_df(paths: Dict[str, str]=None, frames: Dict[str, DataFrame]=None) -> DataFrame:
+    '''Build the DataFrame of export data from {jurisdiction: path}
+    (default: the latest file per jurisdiction in the exports
+    directory). Read the files concurrently, and load them into one
+    DataFrame with a single concat. Frames already built in the
+    'exported' schema ({jurisdiction: frame}, see exportlog.scan) are
+    used as they are, without reading any file.'''
+    if frames is not None:
+        dfs = list(frames.values())
+    else:
+        if paths is None:
+            paths = {i: v[0] for i, v in latest_exports().items()}
+        with ThreadPoolExecutor() as executor:
+            dfs = list(executor.map(lambda i: read_export_file(paths[i], i), paths))
+    return schema.apply(pd.concat([empty_export_df()] + dfs, ignore_index=True), 'exported')
 
-def build_export_df() -> DataFrame:
-    '''Build the DataFrame of all export data. Loop through all
-    jursidictions and get file's data, loaded into one DataFrame.'''
-    jurisdictions = export_jurisdictions()
-    export_df = DataFrame()
-
-    for i in jurisdictions:
-        export_path = get_export_path(jurisdictions[i])
-        if export_path != '':
-            df = pd.read_csv(export_path)
-            df['Name'] = i            # The jurisdiction is also the company's name.
-            export_df = export_df.append(df)
-            df = df.iloc[0:0]                # Clear out the temporary DataFrame, df.
-    
-    return export_df
+def replace_exported(df: DataFrame, exported: DataFrame, jurisdictions: List[str]) -> DataFrame:
+    '''Replace the rows of the given jurisdictions in df with exported.'''
+    df = df[~df['Name'].isin(jurisdictions)]
+    return schema.apply(pd.concat([df, exported], ignore_index=True), 'exported')
 
 def filter_data(df: DataFrame) -> DataFrame:
     '''Filter out any files to not process based on the Filetype.'''
     df = df[~df['FileType'].isin(FILETYPES_TO_IGNORE)] # ~ operator means "not", such that "FileType" is "not in" filetypes to ignore.
     return df
 
-def group_actual_data(df: DataFrame, keys: List, date_cols: Set) -> List[DataFrame]:
-    '''Condense (i.e., aggregate) DataFrame columns. For each date col,
-    find the appropriate aggregate value and group on the keys to get
-    that value. Then, return the results as a list of DataFrames for
-    future consolidation.'''
-    def _function_map() -> dict:
-        '''Dictionary of the date columns that we are interested in, and
-        the aggregate functions that we want to perform on each.'''
-        return {
-            'Download': 'min',
-            'Start': 'min',
-            'End': 'max'
-        }
-
-    def _get_grouped(df: DataFrame, keys: List, col: str, func: Callable) -> DataFrame:
-        '''Helper function to: i. Use a subset of columns from the
-        "parent" DataFrame; and, ii. Get a desired aggregate value
-        based on the keys.'''
-        _keys = keys[:]
-        _keys.append(col)
-
-        df = df[_keys]
-        df = df.groupby(keys).agg({col: func}) # agg method is equivalent to: df.groupby(keys)[col].func
-        df = df.reset_index()                  # reset_index() so that we can merge DataFrames later.
-        return df
-
-    dfs = []
-    fm = _function_map()
+def split_aggregations(aggregations: dict) -> Tuple[dict, Dict[str, dict]]:
+    '''Split the aggregation configuration into pandas named
+    aggregations and percentiles (e.g. 'p95'), grouped by column so each
+    column's percentiles are computed together.'''
+    named, percentiles = {}, {}
+    for i in aggregations:
+        col, func = aggregations[i]
+        if PERCENTILE.fullmatch(func):
+            percentiles.setdefault(col, {})[i] = int(func[1:]) / 100
+        else:
+            named[i] = (col, func)
+    return named, percentiles
 
-    for i in date_cols:
-        dfs.append(_get_grouped(df, keys, i, fm[i])) # Apply the aggregation, and append it to output list.
-    
-    return dfs
-
-def consolidate_data(dfs: List[DataFrame], keys: List) -> DataFrame:
-    '''For each aggregate DataFrame (i.e., DataFrame that contains a
-    desired aggregated value), merge the DataFrames together into one
-    "unique" DataFrame.'''
-    consolidated = dfs[0] # Seed output DataFrame
-    for i in dfs[1:]:     # Already seeded ouput DataFrame, so start from index 1.
-        consolidated = consolidated.merge(
-            i,
-            left_on=keys,
-            right_on=keys,
-            how='left',
-            suffixes=['', '_r']
-        )
-    # All "duplicated" columns will end with suffix '_r'
-    # (e.g., Vendor_r_r_r). Shouldn't be any, but this is a sanity-check.
-    consolidated = consolidated.drop(columns=[col for col in consolidated.columns if col.endswith('_r')])
-    return consolidated
-
-def group_and_consolidate(df: DataFrame, keys: List, date_cols: Set) -> DataFrame:
-    '''Helper function to execute each "aggregation" and "consolidation".
-    We go from one (1) DataFrame to many, to many DataFrames back to
-    one (1).'''
-    dfs = group_actual_data(df, keys, date_cols) # 1 to Many
-    df = consolidate_data(dfs, keys)             # Many to 1
+def aggregate(df: DataFrame, keys: List, aggregations: dict, order_by: str='Download') -> DataFrame:
+    '''Condense (i.e., aggregate) DataFrame columns in one grouped pass.
+    aggregations maps each output column to (input column, function),
+    where function is anything pandas accepts in a named aggregation
+    (min, max, count, first, last, ...) or a percentile such as 'p50'.
+    The group keys are sorted once by groupby. first/last take the row
+    with the earliest/latest order_by of each group (idxmin/idxmax), so
+    the frame itself is never sorted.'''
+    named, percentiles = split_aggregations(aggregations)
+    ordered = {i: named.pop(i) for i in [i for i in named if named[i][1] in ('first', 'last')]}
+    grouped = df.groupby(keys, observed=True)         # Only key combinations that occur, for categorical keys.
+
+    if named:
+        result = grouped.agg(**named)
+    else:
+        result = DataFrame(index=grouped.size().index)
+    if ordered:
+        df = df.reset_index(drop=True)
+        dated = df[df[order_by].notna()]
+        rows = {}
+        for i, (col, func) in ordered.items():
+            if func not in rows:                       # On ties, the first/last such row, as a stable sort would.
+                if func == 'first':
+                    rows[func] = dated.groupby(keys, observed=True)[order_by].idxmin()
+                else:
+                    rows[func] = dated.iloc[::-1].groupby(keys, observed=True)[order_by].idxmax()
+            values = pd.Series(df[col].to_numpy()[rows[func].to_numpy()], index=rows[func].index)
+            result[i] = values.reindex(result.index)
+    for col in percentiles:
+        qs = list(percentiles[col].values())
+        quantiles = grouped[col].quantile(qs).unstack().reindex(columns=qs)
+        for i, q in percentiles[col].items():
+            result[i] = quantiles[q]
+    return result[list(aggregations)].reset_index()
+
+def group_and_consolidate(df: DataFrame, keys: List, aggregations: dict=AGGREGATIONS) -> DataFrame:
+    '''Condense the actually processed data to one row per key, using
+    the aggregations configured in setup.AGGREGATIONS.'''
+    return schema.apply(aggregate(df, keys, aggregations), 'condensed_actuals')
+
+def add_duration(df: DataFrame) -> DataFrame:
+    '''Processing duration (End - Start) in seconds.'''
+    df['Duration'] = (df['End'] - df['Start']).dt.total_seconds()
     return df
 
+def merge_newer(df: DataFrame, newer: DataFrame, keys: List) -> DataFrame:
+    '''Merge newer rows into df, keeping only the latest Download for
+    each key. Missing downloads sort first, so they never win.'''
+    df = schema.apply(pd.concat([df, newer], ignore_index=True), 'actual')
+    df = df.sort_values('Download', kind='stable', na_position='first')
+    df = df.drop_duplicates(subset=keys, keep='last')
+    return df.sort_index().reset_index(drop=True)
+
+def vendor_index(df: DataFrame, column: str='VendorName') -> Dict[str, np.ndarray]:
+    '''Row positions of each vendor in df, sorted by vendor, so a
+    vendor's rows can be taken with iloc instead of a full scan.'''
+    return dict(sorted(df.groupby(column, observed=True).indices.items()))
+
+def latest_watermark(df: DataFrame) -> datetime:
+    '''Latest Download seen, or None if there isn't one.'''
+    if df.empty or df['Download'].isnull().all():
+        return None
+    return df['Download'].max().to_pydatetime()
+
 def to_datetime(df: DataFrame, date_cols: Set) -> DataFrame:
     '''Force type change for specific columns.'''
     for i in date_cols:
-        df[i] = df[i].astype(np.datetime64)
+        df[i] = pd.to_datetime(df[i])
     return df
 
 def apply_feed_type(df: DataFrame, source: DataFrame) -> DataFrame:
     return df.merge(
         source,
-        left_on=['Vendor'],
+        left_on=['VendorName'],
         right_on=['Vendor'],
         suffixes=('', '_r'),
         how='outer'
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from df import DataFrame
+from df import pd
+import math
+from pandas.api.types import is_datetime64_any_dtype
+from threading import Lock
+from typing import List, Tuple
+
+'''Module to serve the vendor drilldown table one page at a time. The
+DataTable runs in custom paging, filtering and sorting mode, so
+filtering, sorting and paging happen here, on the server, and only the
+requested page is sent to the browser.'''
+
+CACHE_SIZE = 256
+OPERATORS = [
+    ['ge ', '>='],
+    ['le ', '<='],
+    ['lt ', '<'],
+    ['gt ', '>'],
+    ['ne ', '!='],
+    ['eq ', '='],
+    ['contains '],
+    ['datestartswith ']
+]
+
+def split_filter_part(part: str) -> Tuple[str, str, object]:
+    '''Split one "{column} operator value" part of a DataTable
+    filter_query into (column, operator, value).'''
+    for operators in OPERATORS:
+        for operator in operators:
+            if operator not in part:
+                continue
+            name_part, value_part = part.split(operator, 1)
+            name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+            value_part = value_part.strip()
+            if value_part and value_part[0] == value_part[-1] and value_part[0] in ('"', "'", '`'):
+                value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+            else:
+                try:
+                    value = float(value_part)
+                except ValueError:
+                    value = value_part
+            return name, operators[0].strip(), value
+    return None, None, None
+
+def apply_filter(df: DataFrame, filter_query: str) -> DataFrame:
+    '''Apply a DataTable filter_query (parts joined with &&).'''
+    if not filter_query:
+        return df
+    for part in filter_query.split(' && '):
+        col, operator, value = split_filter_part(part)
+        if col not in df.columns:
+            continue
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            try:
+                series = df[col]
+                if is_datetime64_any_dtype(series):
+                    value = pd.Timestamp(value)
+                elif isinstance(series.dtype, pd.CategoricalDtype) and operator not in ('eq', 'ne'):
+                    series = series.astype(str)        # Unordered categoricals only compare for equality.
+                df = df.loc[getattr(series, operator)(value)]
+            except (TypeError, ValueError):            # E.g. a number compared to a text column.
+                df = df.iloc[0:0]
+        elif operator == 'contains':
+            df = df.loc[df[col].astype(str).str.contains(str(value), case=False, regex=False)]
+        elif operator == 'datestartswith':
+            df = df.loc[df[col].astype(str).str.startswith(str(value))]
+    return df
+
+def apply_sort(df: DataFrame, sort_by: List[dict]) -> DataFrame:
+    '''Apply a DataTable sort_by ([{'column_id': ..., 'direction': ...}]).'''
+    sort_by = [i for i in sort_by or [] if i['column_id'] in df.columns]
+    if not sort_by:
+        return df
+    return df.sort_values(
+        [i['column_id'] for i in sort_by],
+        ascending=[i['direction'] == 'asc' for i in sort_by],
+        kind='stable'
+    )
+
+def get_page(df: DataFrame, page_current: int, page_size: int) -> Tuple[DataFrame, int]:
+    '''Rows of the requested page, and the total number of pages.'''
+    page_count = max(1, math.ceil(len(df) / page_size))
+    start = page_current * page_size
+    return df.iloc[start:start + page_size], page_count
+
+class VendorCache:
+    '''Bounded LRU cache of vendor drilldown rows, keyed on (data
+    version, vendor). Entries from older versions are dropped as soon as
+    a newer version is seen.'''
+    def __init__(
+        self,
+        size: int=CACHE_SIZE
+    ):
+        self.size = size
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = Lock()
+
+    def vendor_rows(self, version: int, feeds, vendor: str) -> DataFrame:
+        '''Rows of the vendor in feeds.all_actuals, for data version.'''
+        key = (version, vendor)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        rows = feeds.vendor_rows(vendor)
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = rows
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return rows
+
+def query(
+    df: DataFrame,
+    page_current: int,
+    page_size: int,
+    sort_by: List[dict]=None,
+    filter_query: str=''
+) -> Tuple[List[dict], int]:
+    '''One page of a vendor's actually processed files (df), as
+    DataTable records, and the page count.'''
+    df = apply_filter(df, filter_query)
+    df = apply_sort(df, sort_by)
+    df, page_count = get_page(df, page_current or 0, page_size)
+    return df.to_dict('records'), page_count
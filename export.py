@@ -1,17 +1,123 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from data import Feeds
+from df import DataFrame
+import history
 from setup import datetime
-from setup import THIS_DIR
+from setup import EXPORT_DATA_DIR
+from setup import os
+from typing import List
 
 '''Async exporting of data so that the dash app doesn't create a new
-file upon each refresh.'''
+file upon each refresh. Frames are written concurrently, in any of the
+FORMATS, atomically (temp file + rename), and optionally partitioned
+by date and jurisdiction (date=YYYY-MM-DD/jurisdiction=XXX/) so
+downstream tools can prune.'''
 
-def export_data(feeds=Feeds(), ts=datetime.now().strftime('%Y-%m-%d %H.%M.%S')):
+FRAMES = {
+    'expected': 'expected_feeds',
+    'all_actuals': 'processed_feeds',
+    'condensed_actuals': 'condensed_processed_feeds',
+    'exported': 'export_files_data',
+    'feeds': 'feeds_data'
+}
+JURISDICTION_COLUMNS = {                               # Frames that carry the jurisdiction, and its column.
+    'exported': 'Name',
+    'feeds': 'Jurisdiction'
+}
+FORMATS = {                                            # Format: file extension.
+    'csv': 'csv',
+    'csv.gz': 'csv.gz',
+    'csv.zst': 'csv.zst',
+    'parquet': 'parquet',
+    'feather': 'feather'
+}
+
+def write_frame(df: DataFrame, path: str, fmt: str):
+    '''Write df to path in the given format.'''
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        compression = {'csv': None, 'csv.gz': 'gzip', 'csv.zst': 'zstd'}[fmt]
+        df.to_csv(path, index=False, compression=compression)
+
+def write_atomic(df: DataFrame, path: str, fmt: str) -> str:
+    '''Write to a temp file next to path, then rename it into place, so
+    readers never see a partially written file.'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    try:
+        write_frame(df, tmp, fmt)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+def partitions(df: DataFrame, frame: str, date: str, partition: bool) -> List[tuple]:
+    '''(subdirectory, rows) pairs for a frame. Unpartitioned, that's the
+    whole frame in the export directory itself.'''
+    if not partition:
+        return [('', df)]
+    subdirectory = f'date={date}'
+    col = JURISDICTION_COLUMNS.get(frame)
+    if col is None:
+        return [(subdirectory, df)]
+    jurisdictions = df[col].astype(object).fillna('unknown') # Categoricals can't take a new value.
+    return [
+        (f'{subdirectory}/jurisdiction={jurisdiction}', rows)
+        for jurisdiction, rows in df.groupby(jurisdictions, sort=False)
+    ]
+
+def export_data(
+    feeds: Feeds=None,
+    ts: str=None,
+    formats: List[str]=('csv',),
+    partition: bool=False,
+    directory: str=EXPORT_DATA_DIR,
+    workers: int=None
+) -> List[str]:
     '''Export the data to the /data directory, for use in a third
-    party BI tool or archiving.'''
-    feeds.expected.to_csv(f'{THIS_DIR}/data/expected_feeds_{ts}.csv', index=False)
-    feeds.all_actuals.to_csv(f'{THIS_DIR}/data/processed_feeds_{ts}.csv', index=False)
-    feeds.condensed_actuals.to_csv(f'{THIS_DIR}/data/condensed_processed_feeds_{ts}.csv', index=False)
-    feeds.exported.to_csv(f'{THIS_DIR}/data/export_files_data_{ts}.csv', index=False)
-    feeds.feeds.to_csv(f'{THIS_DIR}/data/feeds_data_{ts}.csv', index=False)
-
-export_data()
\ No newline at end of file
+    party BI tool or archiving. feeds and ts default to the latest
+    snapshot and the current time, computed at call time. Returns the
+    written paths.'''
+    feeds = feeds or Feeds.cached()
+    now = datetime.now()
+    ts = ts or now.strftime('%Y-%m-%d %H.%M.%S')
+    date = now.strftime('%Y-%m-%d')
+
+    jobs = []
+    for frame in FRAMES:
+        for subdirectory, rows in partitions(getattr(feeds, frame), frame, date, partition):
+            for fmt in formats:
+                path = os.path.join(directory, subdirectory, f'{FRAMES[frame]}_{ts}.{FORMATS[fmt]}')
+                jobs.append((rows, path, fmt))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_atomic, *i) for i in jobs]
+        return [i.result() for i in futures]
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Export the feeds data for BI tools or archiving.')
+    parser.add_argument('--format', dest='formats', action='append', choices=list(FORMATS), help='Output format; repeat for several (default: csv).')
+    parser.add_argument('--partition', action='store_true', help='Partition by date and jurisdiction.')
+    parser.add_argument('--directory', default=EXPORT_DATA_DIR, help='Output directory.')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent writers.')
+    parser.add_argument('--no-history', action='store_true', help="Don't append feeds and condensed_actuals to the history store.")
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    feeds = Feeds.cached()
+    export_data(
+        feeds,
+        formats=args.formats or ['csv'],
+        partition=args.partition,
+        directory=args.directory,
+        workers=args.workers
+    )
+    if not args.no_history:
+        history.append(feeds)
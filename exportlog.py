@@ -0,0 +1,137 @@
+import argparse
+import csv
+import pandas as pd
+import schema
+import setup
+from setup import ARCHIVE_DIR
+from setup import datetime
+from setup import EXPORT_LOG_DIR
+from setup import EXPORTS_DIR
+from setup import os
+from typing import Dict, List, Tuple
+import xml.etree.ElementTree as ET
+
+'''Module to build the export file log: for each jurisdiction in
+ExportFileLog/<jurisdiction>/Configurations.xml, which vendors' zips
+were archived today. Replaces BuildExportFileLog.ps1: the vendor ids of
+all jurisdictions are resolved in one pooled query, and the archive
+directory is listed once and joined to the vendors on
+<ftp>_<date>_<vendor id>_*.zip, instead of one sqlcmd run per
+jurisdiction and one wildcard scan per vendor. The frames can go
+straight to df.build_export_df, or be written as the usual
+exports/<jurisdiction>_status_*.csv files.
+
+    python exportlog.py'''
+
+DATE_FORMAT = '%Y.%m.%d'                               # Date in the archived zip names.
+
+def read_configurations(path: str) -> Tuple[str, List[str]]:
+    '''FTP username and vendors in scope from a Configurations.xml.'''
+    root = ET.parse(path).getroot()
+    ftp = (root.findtext('ExportFileString/Name') or '').strip()
+    vendors = [i.text.strip() for i in root.iterfind('VendorsInScope/Custodian') if i.text and i.text.strip()]
+    return ftp, vendors
+
+def jurisdictions(directory: str=EXPORT_LOG_DIR) -> Dict[str, Tuple[str, List[str]]]:
+    '''{jurisdiction: (ftp username, vendors in scope)} for every
+    subdirectory with a Configurations.xml. As before, the
+    subdirectory's name is the jurisdiction.'''
+    configs = {}
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda i: i.name):
+            path = f'{entry.path}/Configurations.xml'
+            if entry.is_dir() and os.path.isfile(path):
+                configs[entry.name] = read_configurations(path)
+    return configs
+
+def vendor_ids(vendors: List[str]) -> Dict[str, str]:
+    '''{vendor name: vendor id}, for all vendors in one query. Vendors
+    that aren't in the database are left out.'''
+    if not vendors:
+        return {}
+    with setup.POOL.connection() as conn:
+        rows = setup.QUERIES.execute_sql(conn, vendors, setup.TEMPLATES[4])
+    return {str(name): str(id) for id, name in rows}
+
+def scan_archive(directory: str, date: str, since: float) -> Dict[Tuple[str, str], list]:
+    '''One pass over the archive directory: zips named
+    <ftp>_<date>_<vendor id>_*.zip for date and modified after since (a
+    timestamp), as {(ftp, vendor id): [(name, size, mtime), ...]}.'''
+    archived = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            parts = entry.name.split('_', 3)
+            if len(parts) < 4 or parts[1] != date or not entry.name.lower().endswith('.zip'):
+                continue
+            stat = entry.stat()
+            if stat.st_mtime <= since or not entry.is_file():
+                continue
+            archived.setdefault((parts[0], parts[2]), []).append((entry.name, stat.st_size, stat.st_mtime))
+    for i in archived.values():
+        i.sort()
+    return archived
+
+def status_rows(jurisdiction: str, ftp: str, vendors: List[str], ids: Dict[str, str], archived: dict) -> list:
+    '''Rows of the export status of one jurisdiction, in the 'exported'
+    schema: one Sent row per archived zip of a vendor, or one Not Sent
+    row if it has none.'''
+    rows = []
+    for vendor in vendors:
+        if vendor not in ids:
+            continue
+        files = archived.get((ftp, ids[vendor]))
+        if not files:
+            rows.append((None, ids[vendor], vendor, None, 'Not Sent', None, jurisdiction))
+            continue
+        for name, size, mtime in files:
+            rows.append((size, ids[vendor], vendor, datetime.fromtimestamp(mtime), 'Sent', name.replace(f'{ftp}-', ''), jurisdiction))
+    return rows
+
+def scan(directory: str=EXPORT_LOG_DIR, archive: str=ARCHIVE_DIR, now: datetime=None) -> Dict[str, pd.DataFrame]:
+    '''Export status frames ({jurisdiction: frame}) for the zips archived
+    on now's date (default: today), ready for df.build_export_df.'''
+    now = now or datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    configs = jurisdictions(directory)
+    ids = vendor_ids([v for i in configs.values() for v in i[1]])
+    archived = scan_archive(archive, now.strftime(DATE_FORMAT), midnight.timestamp())
+    return {
+        i: schema.from_rows('exported', status_rows(i, ftp, vendors, ids, archived))
+        for i, (ftp, vendors) in configs.items()
+    }
+
+def modified_time(value) -> str:
+    '''LastModifiedTime as PowerShell writes it, e.g. 5/28/2021 3:32:58 AM.'''
+    if pd.isnull(value):
+        return ''
+    return f'{value.month}/{value.day}/{value.year} {value.strftime("%I:%M:%S %p").lstrip("0")}'
+
+def write_status(frames: Dict[str, pd.DataFrame], directory: str=EXPORTS_DIR, ts: str=None) -> List[str]:
+    '''Write each frame as <jurisdiction>_status_<ts>.csv in the layout
+    of the previous script, atomically (temp file + rename), so the
+    exports watcher only ever sees complete files.'''
+    ts = ts or datetime.now().strftime('%Y%m%d %H%M%S')
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for jurisdiction, df in frames.items():
+        path = f'{directory}/{jurisdiction}_status_{ts}.csv'
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(list(schema.SCHEMAS['export_file']))
+            for size, id, vendor, modified, status, sent_as in df[['Size', 'ID', 'VendorName', 'Modified', 'Status', 'SentAs']].itertuples(index=False):
+                writer.writerow(['' if pd.isnull(size) else size, id, vendor, modified_time(modified), status, '' if pd.isnull(sent_as) else sent_as])
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Write today's export status file per jurisdiction.")
+    parser.add_argument('--configurations', default=EXPORT_LOG_DIR, help='Directory of <jurisdiction>/Configurations.xml.')
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help='Directory of the archived zips.')
+    parser.add_argument('--directory', default=EXPORTS_DIR, help='Where to write the status files.')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(write_status(scan(args.configurations, args.archive), args.directory))
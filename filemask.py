@@ -6,37 +6,50 @@ from setup import timedelta
 filemask configurations to "actual" filemasks that could have been
 delivered by vendors.'''
 
+def offset_date(offset: int, now: datetime=None) -> datetime:
+    '''Offset the reference timestamp (default: now) by the Offset
+    configuration value.'''
+    return (now or datetime.now()) - timedelta(days=int(offset))
+
+def date_masks(date: datetime) -> dict:
+    '''Dictionary of expected filename components. Order matters: yyyy
+    has to be replaced before yy.'''
+    return {
+        'yyyy': date.strftime('%Y'),
+        'yy': date.strftime('%y'),
+        'mm': date.strftime('%m'),
+        'dd': date.strftime('%d')
+    }
+
+def fix(mask: str, masks: dict) -> str:
+    '''Replace the date components in a filename mask.'''
+    for i in masks:
+        if re.search(i, mask) is not None:
+            mask = re.sub(i, str(masks[i]), mask)
+    return re.sub(r'\{\}]', '', mask)
+
 class Filemask:
     '''"Expected" filemask object, which includes both the generic mask
     and the mask for the preceding date, as expected by the PTCCService.'''
     def __init__(
         self,
         mask,
-        offset
+        offset,
+        now: datetime=None
     ):
-        self.now = self._offset(offset)
+        self.now = self._offset(offset, now)
         self.mask: str = self._fix(str(mask))
     
-    def _offset(self, offset: int) -> timedelta:
+    def _offset(self, offset: int, now: datetime=None) -> datetime:
         '''Offset the filemask based on the Offset configuration value.'''
-        return datetime.now() - timedelta(days=offset)
+        return offset_date(offset, now)
 
     def _get_date_masks(self) -> dict:
         '''Dictionary of expected filename components.'''
-        dates = {
-            'yyyy': self.now.strftime('%Y'),
-            'yy': self.now.strftime('%y'),
-            'mm': self.now.strftime('%m'),
-            'dd': self.now.strftime('%d')
-        }
-        return dates
+        return date_masks(self.now)
 
     def _fix(self, mask) -> str:
         '''Private function callable when building DataFrame (in df.py)
         to fix filename masks.'''
-        masks = self._get_date_masks()
-        for i in masks:
-            if re.search(i, mask) is not None:
-                mask = re.sub(i, str(masks[i]), mask)
-        self.mask = re.sub(r'\{\}]', '', mask)
+        self.mask = fix(mask, self._get_date_masks())
         return self.mask
\ No newline at end of file
@@ -0,0 +1,143 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from setup import datetime
+from setup import HISTORY_DIR
+from setup import os
+from typing import List
+
+'''Module to keep the history of the feeds and condensed_actuals frames
+in an append-only, date-partitioned Parquet store, and to query it
+with predicate and column pushdown for trend questions.
+
+Layout:
+    history/<frame>/date=YYYY-MM-DD/part-<captured>.parquet'''
+
+FRAMES = ('feeds', 'condensed_actuals')
+FILTER_COLUMNS = {                                     # Filter: column, per frame.
+    'feeds': {
+        'vendor': 'Vendor Name',
+        'jurisdiction': 'Jurisdiction',
+        'status': 'Status'
+    },
+    'condensed_actuals': {
+        'vendor': 'VendorName'
+    }
+}
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+
+def _partition(frame: str, date: str, directory: str=HISTORY_DIR) -> str:
+    return f'{directory}/{frame}/date={date}'
+
+def _write(table: pa.Table, path: str):
+    '''Write to a temp file and rename it into place.'''
+    tmp = f'{path}.tmp'
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+def append(feeds, captured: datetime=None, directory: str=HISTORY_DIR) -> List[str]:
+    '''Append the feeds and condensed_actuals frames of a Feeds snapshot
+    to the store, under the capture date. Every row gets a Captured
+    timestamp, so several captures a day can be told apart.'''
+    captured = captured or getattr(feeds, 'refreshed_at', None) or datetime.now()
+    paths = []
+    for frame in FRAMES:
+        df = getattr(feeds, frame).reset_index(drop=True).assign(Captured=captured)
+        partition = _partition(frame, captured.strftime('%Y-%m-%d'), directory)
+        os.makedirs(partition, exist_ok=True)
+        path = f'{partition}/part-{captured.strftime("%Y%m%dT%H%M%S%f")}.parquet'
+        _write(pa.Table.from_pandas(df, preserve_index=False), path)
+        paths.append(path)
+    return paths
+
+def _dataset(frame: str, directory: str=HISTORY_DIR) -> ds.Dataset:
+    '''The frame's dataset, with one schema unified across all files
+    (older files may have all-null or since-added columns).'''
+    path = f'{directory}/{frame}'
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING, exclude_invalid_files=True)
+    schemas = [i.physical_schema for i in dataset.get_fragments()]
+    if not schemas:
+        return dataset
+    schema = pa.unify_schemas(schemas + [dataset.schema], promote_options='permissive')
+    return ds.dataset(path, format='parquet', partitioning=PARTITIONING, schema=schema, exclude_invalid_files=True)
+
+def _isin(column: str, values) -> ds.Expression:
+    if isinstance(values, str):
+        values = [values]
+    return ds.field(column).isin(list(values))
+
+def query(
+    frame: str,
+    vendors: List[str]=None,
+    jurisdictions: List[str]=None,
+    start: str=None,
+    end: str=None,
+    statuses: List[str]=None,
+    columns: List[str]=None,
+    directory: str=HISTORY_DIR
+) -> pd.DataFrame:
+    '''Read history rows of a frame. The date range (inclusive,
+    YYYY-MM-DD) prunes partitions; vendors, jurisdictions and statuses
+    are pushed down to the Parquet reader, and only the requested
+    columns (plus date) are read.'''
+    if frame not in FRAMES:
+        raise ValueError(f'No history for {frame}; expected one of {FRAMES}.')
+    if not os.path.isdir(f'{directory}/{frame}'):
+        return pd.DataFrame(columns=columns)
+
+    filters = {
+        'vendor': vendors,
+        'jurisdiction': jurisdictions,
+        'status': statuses
+    }
+    expression = None
+    conditions = []
+    if start:
+        conditions.append(ds.field('date') >= str(start))
+    if end:
+        conditions.append(ds.field('date') <= str(end))
+    for i in filters:
+        if filters[i] is None:
+            continue
+        if i not in FILTER_COLUMNS[frame]:
+            raise ValueError(f'{frame} history cannot be filtered by {i}.')
+        conditions.append(_isin(FILTER_COLUMNS[frame][i], filters[i]))
+    for i in conditions:
+        expression = i if expression is None else expression & i
+
+    if columns is not None and 'date' not in columns:
+        columns = list(columns) + ['date']
+    return _dataset(frame, directory).to_table(columns=columns, filter=expression).to_pandas()
+
+def compact(frame: str, dates: List[str]=None, min_files: int=2, directory: str=HISTORY_DIR) -> List[str]:
+    '''Merge each date partition with at least min_files files into one
+    file. The merged file is in place before the small files are
+    removed, so readers see every row at any time (possibly twice, but
+    never none). Files appended while compacting are left alone.'''
+    root = f'{directory}/{frame}'
+    if not os.path.isdir(root):
+        return []
+    compacted = []
+    for entry in sorted(os.scandir(root), key=lambda i: i.name):
+        if not entry.is_dir() or not entry.name.startswith('date='):
+            continue
+        if dates is not None and entry.name[len('date='):] not in dates:
+            continue
+        files = sorted(i.path for i in os.scandir(entry.path) if i.name.endswith('.parquet'))
+        if len(files) < min_files:
+            continue
+        tables = [pq.read_table(i) for i in files]
+        table = pa.concat_tables(tables, promote_options='permissive')
+        if 'Captured' in table.column_names:
+            table = table.sort_by('Captured')
+        path = f'{entry.path}/part-{datetime.now().strftime("%Y%m%dT%H%M%S%f")}-compacted.parquet'
+        _write(table, path)
+        for i in files:
+            os.remove(i)
+        compacted.append(path)
+    return compacted
+
+if __name__ == '__main__':
+    for i in FRAMES:
+        compact(i)
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from df import DataFrame
+from df import pd
+from threading import Lock
+from typing import List, Optional, Tuple
+
+'''Module to send the feeds table to open dashboards as versioned
+deltas. Each dashboard polls with the data version it shows: if it is
+current, nothing is sent; if it is a recent version, only the rows that
+were removed and added since; otherwise all rows. Rows carry an id (a
+hash of their values), which the browser uses to apply a delta to the
+table it already has.'''
+
+HISTORY_SIZE = 16
+
+def row_ids(df: DataFrame) -> List[str]:
+    '''Id per row: a hash of its values, numbered if rows repeat, so the
+    same row has the same id in every version.'''
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    occurrence = hashes.groupby(hashes).cumcount()
+    return [f'{h:016x}.{n}' for h, n in zip(hashes, occurrence)]
+
+def diff(old: List[str], new: List[str], records: List[dict]) -> Optional[dict]:
+    '''Ids of the rows removed from old, and the rows added in new with
+    their positions in new, in order. None if the rows that were kept
+    changed order, as removing and inserting can't rebuild that.'''
+    old_ids, new_ids = set(old), set(new)
+    if [i for i in old if i in new_ids] != [i for i in new if i in old_ids]:
+        return None
+    return {
+        'removed': [i for i in old if i not in new_ids],
+        'added': [[n, records[n]] for n, i in enumerate(new) if i not in old_ids]
+    }
+
+class FeedsDeltas:
+    '''Payloads that bring a dashboard from the data version it shows to
+    the current one. The row ids of the last size versions are kept;
+    a dashboard on an older or unknown version (a new page, another
+    serving worker's version) gets all rows. The records of the current
+    version are built once, not per poll.'''
+    def __init__(
+        self,
+        size: int=HISTORY_SIZE
+    ):
+        self.size = size
+        self._ids = OrderedDict()                      # Version: row ids, oldest first.
+        self._current = None                           # (version, records) of the newest version seen.
+        self._lock = Lock()
+
+    def _records(self, version, feeds) -> Tuple[List[str], List[dict]]:
+        '''Row ids and records (with their ids) of the version.'''
+        with self._lock:
+            if self._current is not None and self._current[0] == version:
+                return self._ids[version], self._current[1]
+        ids = row_ids(feeds.feeds)
+        records = feeds.feeds.to_dict('records')
+        for id, record in zip(ids, records):
+            record['id'] = id
+        with self._lock:
+            self._ids[version] = ids
+            self._ids.move_to_end(version)
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            self._current = (version, records)
+        return ids, records
+
+    def payload(self, version, feeds, client_version) -> Optional[dict]:
+        '''None if the dashboard shows version already. Otherwise
+        {'version', 'full': True, 'rows'} or {'version', 'full': False,
+        'removed', 'added'}. A delta is only sent while it is smaller
+        than the table.'''
+        if client_version == version:
+            return None
+        ids, records = self._records(version, feeds)
+        with self._lock:
+            old = self._ids.get(client_version) if client_version is not None else None
+        if old is not None:
+            delta = diff(old, ids, records)
+            if delta is not None and len(delta['removed']) + len(delta['added']) < len(ids):
+                return dict(version=version, full=False, **delta)
+        return {'version': version, 'full': True, 'rows': records}
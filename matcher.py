@@ -0,0 +1,180 @@
+from collections import defaultdict, deque
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+'''Module to match expected filemasks against process log filenames on
+the client. Equivalent to the Filemask query's
+"log.filename LIKE '%' + mask + '%'" CROSS APPLY, but the process log
+is read once and every mask is matched in a single pass per filename.'''
+
+LIKE_WILDCARDS = re.compile(r'[%_\[]')
+LIKE_FRAGMENTS = re.compile(r'%|_|\[[^\]]*\]?')
+
+class AhoCorasick:
+    '''Multi-pattern substring matcher. search() returns the index of
+    every pattern found in the text in one pass over the text.'''
+    def __init__(
+        self,
+        patterns: List[str]
+    ):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for i, pattern in enumerate(patterns):
+            self._add(pattern, i)
+        self._build()
+
+    def _add(self, pattern: str, index: int):
+        '''Add a pattern to the trie.'''
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._out[state].append(index)
+
+    def _build(self):
+        '''Breadth-first pass to set the failure links, and merge the
+        outputs of each failure state into its parent.'''
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text: str) -> Set[int]:
+        '''Indices of all patterns that occur in text.'''
+        found = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+def like_to_regex(mask: str) -> re.Pattern:
+    '''Translate a LIKE '%mask%' pattern (with its own % _ [] wildcards)
+    to a regular expression. Inside [], - is a range (as in [0-9]), a
+    leading ^ negates the group and every other character is literal.'''
+    pattern = ''
+    i = 0
+    while i < len(mask):
+        char = mask[i]
+        if char == '%':
+            pattern += '.*'
+        elif char == '_':
+            pattern += '.'
+        elif char == '[':
+            end = mask.find(']', i + 1)
+            if end == -1:
+                pattern += re.escape(char)
+            else:
+                group = mask[i + 1:end]
+                negate = group.startswith('^')
+                group = ''.join(c if c == '-' else re.escape(c) for c in group[negate:])
+                if group:
+                    pattern += f'[^{group}]' if negate else f'[{group}]'
+                else:
+                    pattern += '(?!)'                  # An empty group matches nothing.
+                i = end
+        else:
+            pattern += re.escape(char)
+        i += 1
+    return re.compile(pattern, re.DOTALL)
+
+class VendorMasks:
+    '''All expected masks for one vendor, compiled into one Aho-Corasick
+    automaton. Masks using LIKE wildcards are added by their longest
+    literal fragment and confirmed with a regular expression.'''
+    def __init__(
+        self
+    ):
+        self._masks: Dict[str, List[int]] = defaultdict(list)
+        self._automaton = None
+        self._patterns: List[Tuple[str, Optional[re.Pattern]]] = []
+        self._unanchored: List[Tuple[str, re.Pattern]] = []
+
+    def add(self, mask: str, index: int):
+        '''Register the expected row index for a mask. SQL Server's
+        default collation is case insensitive, so masks are lowered.'''
+        self._masks[str(mask).lower()].append(index)
+
+    def build(self):
+        '''Compile the automaton and regular expressions.'''
+        literals = []
+        for mask in self._masks:
+            if not LIKE_WILDCARDS.search(mask):
+                literals.append(mask)
+                self._patterns.append((mask, None))
+                continue
+            literal = max(LIKE_FRAGMENTS.split(mask), key=len)
+            if literal:
+                literals.append(literal)
+                self._patterns.append((mask, like_to_regex(mask)))
+            else:
+                self._unanchored.append((mask, like_to_regex(mask)))
+        self._automaton = AhoCorasick(literals)
+
+    def match(self, filename: str) -> List[int]:
+        '''Expected row indices whose mask occurs in the filename.'''
+        filename = str(filename).lower()
+        indices = []
+        for i in self._automaton.search(filename):
+            mask, regex = self._patterns[i]
+            if regex is None or regex.search(filename):
+                indices.extend(self._masks[mask])
+        for mask, regex in self._unanchored:
+            if regex.search(filename):
+                indices.extend(self._masks[mask])
+        return indices
+
+def build_matchers(filemask: dict) -> Dict[str, VendorMasks]:
+    '''Group the expected masks (as built by df.expected_converter()) by
+    vendor and compile one matcher per vendor.'''
+    matchers = defaultdict(VendorMasks)
+    for i in filemask:
+        matchers[filemask[i]['Vendor']].add(filemask[i]['Mask'], i)
+    for i in matchers:
+        matchers[i].build()
+    return dict(matchers)
+
+def _later(download, current) -> bool:
+    '''True if download is later than current. Missing downloads sort
+    last, as they do in "order by log.download desc".'''
+    if download is None:
+        return False
+    return current is None or download > current
+
+def match_latest(filemask: dict, log_rows: Iterable) -> List[tuple]:
+    '''Match process log rows (as returned by queries.ProcessLog) to the
+    expected masks, keeping the latest download per expected mask. Rows
+    come back in the same shape as the Filemask query, i.e.
+    df_columns('actual').'''
+    matchers = build_matchers(filemask)
+    latest = {}
+    for row in log_rows:
+        matcher = matchers.get(row[6])             # Vendor name.
+        if matcher is None:
+            continue
+        for i in matcher.match(row[0]):            # File name.
+            if i not in latest or _later(row[2], latest[i][2]):
+                latest[i] = row
+    return [
+        (
+            filemask[i]['Mask'],
+            filemask[i]['VendorNumber'],
+            filemask[i]['FeedType'],
+            *latest[i]
+        ) for i in filemask if i in latest
+    ]
@@ -0,0 +1,170 @@
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+'''Module to time the stages of a Feeds build, the query phases and the
+Dash callbacks, and render them in the Prometheus text format for the
+/metrics endpoint. Metrics are per process: with several serving
+workers, each one reports its own callbacks.'''
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str='') -> str:
+    pairs = [f'{i}="{_escape(v)}"' for i, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class Metric:
+    '''Base metric: a name, help text, label names and a lock.'''
+    kind = ''
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...]=()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[i]) for i in self.labels)
+
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ] + self.samples()
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...]=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f'{self.name}{_labels(self.labels, i)} {_number(v)}' for i, v in sorted(values.items())]
+
+class Gauge(Metric):
+    '''A value that is set, or read from a function at render time.'''
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...]=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        '''Read the (unlabelled) value from function on every render.'''
+        self._function = function
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._function is not None:
+            value = self._function()
+            if value is not None:
+                values[()] = value
+        return [f'{self.name}{_labels(self.labels, i)} {_number(v)}' for i, v in sorted(values.items())]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...]=(), buckets: Tuple[float, ...]=BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[Tuple[str, ...], list] = {}  # Labels: [per-bucket counts, sum].
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * len(self.buckets), 0.0]
+            self._values[key][0][bisect_left(self.buckets, value)] += 1
+            self._values[key][1] += value
+
+    def time(self, **labels) -> 'Timer':
+        '''Context manager (or decorator) that observes its duration.'''
+        return Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {i: (list(v[0]), v[1]) for i, v in self._values.items()}
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="{}"'.format(_number(bucket))
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+class Timer(ContextDecorator):
+    '''Observe the wall time of a with block, or of each call of a
+    decorated function, in a histogram.'''
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self) -> 'Timer':
+        '''A fresh Timer per decorated call, so calls can overlap.'''
+        return Timer(self.histogram, self.labels)
+
+    def __enter__(self) -> 'Timer':
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.seconds = perf_counter() - self.start
+        self.histogram.observe(self.seconds, **self.labels)
+        return False
+
+def render() -> str:
+    '''All metrics in the Prometheus text exposition format.'''
+    lines = []
+    for i in REGISTRY:
+        lines.extend(i.render())
+    return '\n'.join(lines) + '\n'
+
+REGISTRY: List[Metric] = []
+QUERY_SECONDS = Histogram('vendorreport_query_seconds', 'Time per query phase (init, insert, select).', ('template', 'phase'))
+QUERY_ROWS = Counter('vendorreport_query_rows_total', 'Rows inserted into temp tables and selected.', ('template', 'phase'))
+QUERY_CACHE = Counter('vendorreport_query_cache_total', 'Query result cache lookups, by result (hit or miss).', ('template', 'result'))
+STAGE_SECONDS = Histogram('vendorreport_stage_seconds', 'Time per Feeds build stage.', ('stage',))
+CALLBACK_SECONDS = Histogram('vendorreport_callback_seconds', 'Time per Dash callback.', ('callback',))
+LIVE_UPDATES = Counter('vendorreport_live_updates_total', 'Dashboard polls, by reply (unchanged, delta or full).', ('reply',))
+REFRESHES = Counter('vendorreport_refreshes_total', 'Snapshot refreshes, by result.', ('result',))
+CRITICAL_PATH_SECONDS = Gauge('vendorreport_critical_path_seconds', 'Duration of the longest chain of stages in the last Feeds build.')
+LAST_REFRESH_SECONDS = Gauge('vendorreport_last_refresh_seconds', 'Build time of the current Feeds snapshot.')
@@ -1,3 +1,8 @@
+from datetime import datetime
+import metrics
+from time import perf_counter
+from typing import List, Tuple
+
 '''Module to build query templates and execute them.'''
 
 class QueriesFactory:
@@ -17,6 +22,8 @@ class QueriesFactory:
         self.register_template(templates, 'configs', Configs)
         self.register_template(templates, 'expected', Expected)
         self.register_template(templates, 'filemask', Filemask)
+        self.register_template(templates, 'process_log', ProcessLog)
+        self.register_template(templates, 'vendor_ids', VendorIds)
         return templates
 
     def get_template(self, key: str):
@@ -29,6 +36,19 @@ class QueriesFactory:
             return template()
 
 class Queries:
+    '''Runs the templates (which are Queries themselves). With a cache
+    (see querycache.py), the results of cacheable templates are served
+    from it while fresh, without touching the database.'''
+    table = ''
+    columns: Tuple[str, ...] = ()
+    cacheable = False                                  # Results only change with slow-changing tables.
+
+    def __init__(
+        self,
+        cache=None
+    ):
+        self.cache = cache
+
     def init_temp_table(self) -> str:
         '''Initialize the temp table with schema.'''
         ...
@@ -37,20 +57,126 @@ class Queries:
         '''Insert the values into the temp table.'''
         ...
 
+    def insert_statement(self) -> str:
+        '''Parameterized insert into the temp table, one placeholder per
+        column. Used with rows() for bulk loading.'''
+        return 'INSERT INTO {table} ({columns}) VALUES ({params})'.format(
+            table=self.table,
+            columns=', '.join(self.columns),
+            params=', '.join('?' for _ in self.columns)
+        )
+
+    def rows(self, values: dict) -> List[tuple]:
+        '''Values to insert into the temp table, as one tuple per row in
+        the same order as columns.'''
+        ...
+
     def query_template(self) -> str:
         '''Execute the temp table query.'''
         ...
-    
-    def execute_sql(self, conn,  file_mask, template) -> list:
-        '''Initialize a temp table, insert values, and execute query.'''
-        conn._execute(template.init_temp_table())
-        conn._execute(template.insert_values(file_mask))
-        return conn._execute_select_all(template.query_template())
+
+    def execute_sql(self, conn,  file_mask, template, bulk: bool=True) -> list:
+        '''Initialize a temp table, insert values, and execute query. By
+        default the values are bulk loaded as parameter arrays; pass
+        bulk=False to send the concatenated INSERT statements instead.
+        Each phase (init, insert, select) is timed in metrics.'''
+        key = self._cache_key(template, file_mask, 'rows')
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        name = type(template).__name__
+        if bulk:
+            self.load_temp_table(conn, file_mask, template)
+        else:
+            with metrics.QUERY_SECONDS.time(template=name, phase='init'):
+                conn._execute(template.init_temp_table())
+            with metrics.QUERY_SECONDS.time(template=name, phase='insert'):
+                conn._execute(template.insert_values(file_mask))
+            metrics.QUERY_ROWS.inc(len(file_mask), template=name, phase='insert')
+        with metrics.QUERY_SECONDS.time(template=name, phase='select'):
+            results = conn._execute_select_all(template.query_template())
+        metrics.QUERY_ROWS.inc(len(results), template=name, phase='select')
+        if key:
+            self.cache.put(key, [tuple(i) for i in results])
+        return results
+
+    def load_temp_table(self, conn, values, template):
+        '''Initialize a temp table and bulk load values into it.'''
+        name = type(template).__name__
+        with metrics.QUERY_SECONDS.time(template=name, phase='init'):
+            conn._execute(template.init_temp_table())
+        with metrics.QUERY_SECONDS.time(template=name, phase='insert'):
+            rows = template.rows(values)
+            conn._execute_many(template.insert_statement(), rows)
+        metrics.QUERY_ROWS.inc(len(rows), template=name, phase='insert')
+
+    def stream_sql(self, conn, values, template, size: int=10000):
+        '''Like execute_sql, but yield the results in batches of rows.'''
+        self.load_temp_table(conn, values, template)
+        batches = conn._execute_select_batches(template.query_template(), size)
+        yield from self._timed(batches, template, len)
+
+    def stream_columns(self, conn, values, template, size: int=10000):
+        '''Like stream_sql, but yield each batch as a tuple of columns
+        (see df.df_from_sql), so no per-row lists are built. Cached
+        results are stored once all batches have been read.'''
+        key = self._cache_key(template, values, 'columns')
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            yield from cached
+            return
+        self.load_temp_table(conn, values, template)
+        batches = conn._execute_select_columns(template.query_template(), size)
+        results = []
+        for batch in self._timed(batches, template, lambda i: len(i[0]) if i else 0):
+            if key:
+                results.append(batch)
+            yield batch
+        if key:
+            self.cache.put(key, results)
+
+    def _cache_key(self, template, values, shape: str) -> str:
+        '''Cache key of a template run with values, or None if it isn't
+        cached. The key covers the query text and the inserted rows.'''
+        if self.cache is None or not self.cache.enabled or not template.cacheable:
+            return None
+        return self.cache.key(type(template).__name__, shape, template.query_template(), template.rows(values))
+
+    def invalidate_cache(self, template: str=None) -> int:
+        '''Drop the cached results of a template (by class name, e.g.
+        'Expected'), or of all templates.'''
+        if self.cache is None:
+            return 0
+        return self.cache.invalidate(template)
+
+    def _timed(self, batches, template, count):
+        '''Pass batches through, timing the select phase. Only the time
+        spent fetching counts, not the time the consumer spends on each
+        batch.'''
+        name = type(template).__name__
+        seconds, rows = 0.0, 0
+        try:
+            while True:
+                start = perf_counter()
+                batch = next(batches, None)
+                seconds += perf_counter() - start
+                if batch is None:
+                    break
+                rows += count(batch)
+                yield batch
+        finally:
+            metrics.QUERY_SECONDS.observe(seconds, template=name, phase='select')
+            metrics.QUERY_ROWS.inc(rows, template=name, phase='select')
 
 class Configs(Queries):
+    table = '#configs'
+    cacheable = True
+    columns = ('vendor_name', 'name', 'offset')
+
     def init_temp_table(self) -> str:
         return '''
-            IF (Object_ID('tempdv..#configs') IS NOT NULL)
+            IF (Object_ID('tempdb..#configs') IS NOT NULL)
             BEGIN
                 DROP TABLE #configs
             END
@@ -81,6 +207,15 @@ class Configs(Queries):
             )
         return sql
 
+    def rows(self, configs: dict) -> List[tuple]:
+        return [
+            (
+                i,
+                configs[i]['name'],
+                int(configs[i]['offset'])
+            ) for i in configs
+        ]
+
     def query_template(self) -> str:
         return '''
             select
@@ -92,10 +227,14 @@ class Configs(Queries):
             join [vendors] v on conf.vendor_name = v.name
         '''
 
-class Expected(Queries):    
+class Expected(Queries):
+    table = '#expected'
+    cacheable = True
+    columns = ('vendor_name', 'name', 'offset', 'number', 'feed_type')
+
     def init_temp_table(self) -> str:
         return '''
-            IF (Object_ID('tempdv..#expected') IS NOT NULL)
+            IF (Object_ID('tempdb..#expected') IS NOT NULL)
             BEGIN
                 DROP TABLE #expected
             END
@@ -126,14 +265,25 @@ class Expected(Queries):
 
         for i in filemask:
             sql += values.format(
-                vendor_name=filemask[i]['vendor_name'],
-                name=filemask[i]['name'],
-                offset=int(filemask[i]['offset']),
-                number=int(filemask[i]['number']),
-                feed_type=filemask[i]['feed_type']
+                vendor_name=filemask[i]['Vendor'],
+                name=filemask[i]['Name'],
+                offset=int(filemask[i]['Offset']),
+                number=int(filemask[i]['VendorNumber']),
+                feed_type=filemask[i]['FeedType']
             )
         return sql
 
+    def rows(self, filemask: dict) -> List[tuple]:
+        return [
+            (
+                filemask[i]['Vendor'],
+                filemask[i]['Name'],
+                int(filemask[i]['Offset']),
+                int(filemask[i]['VendorNumber']),
+                filemask[i]['FeedType']
+            ) for i in filemask
+        ]
+
     def query_template(self) -> str:
         return '''
             select
@@ -153,9 +303,12 @@ class Expected(Queries):
         '''
 
 class Filemask(Queries):
+    table = '#filemask'
+    columns = ('file_mask', 'vendor_name', 'name', 'number', 'feed_type')
+
     def init_temp_table(self) -> str:
         return '''
-            IF (Object_ID('tempdv..#filemask') IS NOT NULL)
+            IF (Object_ID('tempdb..#filemask') IS NOT NULL)
             BEGIN
                 DROP TABLE #filemask
             END
@@ -186,15 +339,26 @@ class Filemask(Queries):
 
         for i in filemask:
             sql += values.format(
-                FileMask=filemask[i]['mask'],
-                vendor_name=filemask[i]['vendor_name'],
-                name=filemask[i]['name'],
-                number=int(filemask[i]['number']),
-                feed_type=filemask[i]['feed_type']
+                FileMask=filemask[i]['Mask'],
+                vendor_name=filemask[i]['Vendor'],
+                name=filemask[i]['Name'],
+                number=int(filemask[i]['VendorNumber']),
+                feed_type=filemask[i]['FeedType']
             )
 
         return sql
 
+    def rows(self, filemask: dict) -> List[tuple]:
+        return [
+            (
+                filemask[i]['Mask'],
+                filemask[i]['Vendor'],
+                filemask[i]['Name'],
+                int(filemask[i]['VendorNumber']),
+                filemask[i]['FeedType']
+            ) for i in filemask
+        ]
+
     def query_template(self) -> str:
         return '''
             select
@@ -231,4 +395,94 @@ class Filemask(Queries):
                     AND v.name = masks.vendor_name
                 order by log.download desc
             ) log
-        '''
\ No newline at end of file
+        '''
+
+class ProcessLog(Queries):
+    '''Date-bounded slice of the process log for the expected vendors,
+    read once and matched against the filemasks on the client (see
+    matcher.py) instead of the per-mask CROSS APPLY in Filemask. If
+    since is given, only rows downloaded after it are read.'''
+    table = '#process_log_vendors'
+    columns = ('vendor_name',)
+
+    def __init__(
+        self,
+        lookback_days: int=7,
+        since: datetime=None
+    ):
+        self.lookback_days = lookback_days
+        self.since = since
+
+    def init_temp_table(self) -> str:
+        return '''
+            IF (Object_ID('tempdb..#process_log_vendors') IS NOT NULL)
+            BEGIN
+                DROP TABLE #process_log_vendors
+            END
+
+            CREATE TABLE #process_log_vendors (
+                vendor_name VARCHAR(MAX)
+            )
+        '''
+
+    def rows(self, filemask: dict) -> List[tuple]:
+        return [(i,) for i in {filemask[i]['Vendor'] for i in filemask}]
+
+    def query_template(self) -> str:
+        return '''
+            select
+                log.FileName,
+                ft.name,
+                log.download,
+                log.archive_time,
+                log.start,
+                log.end,
+                v.name,
+                c.name
+            from [process_log] log
+            join [file_config] fic on log.feed_id = fic.id
+            join [feed_types] ft on fic.type_id = ft.id
+            join [feed_config] fec on fic.config_id = fec.id
+            join [vendors] v ON fec.vendor_id = v.id
+            join [crm] c ON fec.id = c.id
+            join #process_log_vendors vend on v.name = vend.vendor_name
+            where log.download >= DATEADD(day, -{lookback_days}, CAST(GETDATE() AS DATE))
+        '''.format(lookback_days=int(self.lookback_days)) + self._since_filter()
+
+    def _since_filter(self) -> str:
+        '''Restrict to rows downloaded after the since watermark.'''
+        if self.since is None:
+            return ''
+        return '''
+                AND log.download > CONVERT(DATETIME2, '{since}', 121)
+        '''.format(since=self.since.strftime('%Y-%m-%d %H:%M:%S.%f'))
+
+class VendorIds(Queries):
+    '''Database ids of the vendors in scope of the export file log
+    (see exportlog.py), resolved for all jurisdictions at once.'''
+    table = '#vendor_ids'
+    columns = ('vendor_name',)
+
+    def init_temp_table(self) -> str:
+        return '''
+            IF (Object_ID('tempdb..#vendor_ids') IS NOT NULL)
+            BEGIN
+                DROP TABLE #vendor_ids
+            END
+
+            CREATE TABLE #vendor_ids (
+                vendor_name VARCHAR(100)
+            )
+        '''
+
+    def rows(self, vendors: list) -> List[tuple]:
+        return [(i,) for i in sorted(set(vendors))]
+
+    def query_template(self) -> str:
+        return '''
+            select
+                v.id,
+                v.name
+            from #vendor_ids vis
+            join [vendors] v with (nolock) on vis.vendor_name = v.name
+        '''
@@ -0,0 +1,137 @@
+import argparse
+import hashlib
+import metrics
+import pickle
+from setup import os
+from setup import QUERY_CACHE_DIR
+from setup import QUERY_CACHE_TTL
+from threading import Lock
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+'''Module to cache the results of the slow-changing queries (Configs and
+Expected: vendors, feed and file configurations, CRM), so a refresh
+only runs the process log match against the database. Results are kept
+in memory and as one pickle per query on disk, so every serving worker
+and a restarted process share them. An entry expires TTL seconds after
+it was written, or when it is invalidated (e.g. after a configuration
+change in the database):
+
+    python querycache.py --invalidate
+    python querycache.py --invalidate Expected
+
+Layout:
+    cache/<template>/<sha256 of the query and its parameters>.pickle'''
+
+class QueryCache:
+    '''Query results by key (see key()), with a TTL in seconds; a TTL of
+    0 disables the cache. Hits and misses are counted per template, in
+    hits and misses and in metrics.QUERY_CACHE.'''
+    def __init__(
+        self,
+        directory: str=QUERY_CACHE_DIR,
+        ttl: float=QUERY_CACHE_TTL
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = Lock()
+        self._memory: Dict[str, Tuple[int, object]] = {}   # key: (mtime_ns of the file, results).
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def key(self, template: str, *parts) -> str:
+        '''Key of a query: the template's name, and a hash of whatever
+        determines its results (query text, inserted rows, shape).'''
+        digest = hashlib.sha256(repr(parts).encode()).hexdigest()
+        return f'{template}/{digest}'
+
+    def _path(self, key: str) -> str:
+        return f'{self.directory}/{key}.pickle'
+
+    def _count(self, key: str, hit: bool):
+        template = key.split('/')[0]
+        counts = self.hits if hit else self.misses
+        with self._lock:
+            counts[template] = counts.get(template, 0) + 1
+        metrics.QUERY_CACHE.inc(template=template, result='hit' if hit else 'miss')
+
+    def get(self, key: str) -> Optional[object]:
+        '''Cached results, or None if there are none or they expired.
+        The file is checked on every get, so an invalidation or a newer
+        result written by another process is seen at once.'''
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            stat = None
+        if stat is None or time() - stat.st_mtime > self.ttl:
+            self._memory.pop(key, None)
+            self._count(key, False)
+            return None
+        cached = self._memory.get(key)
+        if cached is not None and cached[0] == stat.st_mtime_ns:
+            self._count(key, True)
+            return cached[1]
+        try:
+            with open(self._path(key), 'rb') as f:
+                results = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._count(key, False)
+            return None
+        self._memory[key] = (stat.st_mtime_ns, results)
+        self._count(key, True)
+        return results
+
+    def put(self, key: str, results: object):
+        '''Store results, atomically (temp file + rename), so readers
+        never load a partial file.'''
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._memory[key] = (os.stat(path).st_mtime_ns, results)
+
+    def invalidate(self, template: str=None) -> int:
+        '''Drop the cached results of one template (by name), or of all of
+        them. Returns the number of entries removed from disk.'''
+        removed = 0
+        for key in self.keys(template):
+            try:
+                os.remove(self._path(key))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        for key in [i for i in self._memory if template is None or i.split('/')[0] == template]:
+            self._memory.pop(key, None)
+        return removed
+
+    def keys(self, template: str=None) -> List[str]:
+        '''Keys of the entries on disk, expired or not.'''
+        if not os.path.isdir(self.directory):
+            return []
+        templates = [template] if template else sorted(os.listdir(self.directory))
+        keys = []
+        for i in templates:
+            if os.path.isdir(f'{self.directory}/{i}'):
+                keys.extend(f'{i}/{v[:-len(".pickle")]}' for v in sorted(os.listdir(f'{self.directory}/{i}')) if v.endswith('.pickle'))
+        return keys
+
+def parse_args(args: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the query result cache.')
+    parser.add_argument('--directory', default=QUERY_CACHE_DIR)
+    parser.add_argument('--invalidate', nargs='?', const='', metavar='TEMPLATE', help='Drop the cached results (of one template, e.g. Expected).')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args()
+    cache = QueryCache(args.directory)
+    if args.invalidate is not None:
+        print(f'{cache.invalidate(args.invalidate or None)} entries removed')
+    else:
+        for key in cache.keys():
+            print(key)
@@ -0,0 +1,170 @@
+from data import Feeds
+import exportlog
+import logging
+import metrics
+import setup
+from setup import datetime
+from setup import EXPORT_SOURCE
+from setup import os
+from setup import REFRESH_INTERVAL
+from setup import SNAPSHOT_CHECK_INTERVAL
+from setup import SNAPSHOT_DIR
+from setup import Tuple
+import snapshot
+from threading import Event, Lock, Thread
+import time
+
+'''Module to keep a Feeds snapshot up to date in the background, so the
+dashboard doesn't have to be restarted to see newly processed files.'''
+
+logger = logging.getLogger(__name__)
+
+class Refresher:
+    '''Hold the current Feeds snapshot and its data version. A background
+    thread merges in process log rows newer than the snapshot's
+    watermark every interval seconds, then swaps the new snapshot in.
+    Readers should call snapshot() (or feeds) once per request and use
+    that object throughout.'''
+    def __init__(
+        self,
+        interval: float=REFRESH_INTERVAL,
+        feeds: Feeds=None
+    ):
+        self.interval = interval
+        self._snapshot: Tuple[int, Feeds] = (1, feeds or Feeds.cached())
+        self._swap_lock = Lock()                       # Serializes writers; readers never wait.
+        self._stop = Event()
+        self._thread = None
+
+    @property
+    def version(self) -> int:
+        '''Current data version. Increases with every refresh.'''
+        return self._snapshot[0]
+
+    @property
+    def feeds(self) -> Feeds:
+        '''Current Feeds snapshot.'''
+        return self._snapshot[1]
+
+    def snapshot(self) -> Tuple[int, Feeds]:
+        '''Current data version and Feeds snapshot, read together.'''
+        return self._snapshot
+
+    def refresh(self) -> Feeds:
+        '''Build the next snapshot and swap it in. Expected filemasks are
+        fixed for the build date, so a new day gets a full rebuild. An
+        edited configurations file re-runs Configs and Expected (see
+        Feeds.reconfigure). Otherwise only newer process log rows are
+        fetched. With EXPORT_SOURCE 'scan', the archive is rescanned on
+        every refresh, as there are no export files to watch.'''
+        def _next(feeds: Feeds) -> Feeds:
+            if feeds.now.date() != datetime.now().date():
+                return Feeds()
+            if getattr(feeds, 'config_version', None) != setup.CONFIG_REGISTRY.version:
+                feeds = feeds.reconfigure()
+            feeds = feeds.refresh()
+            if EXPORT_SOURCE == 'scan':
+                feeds = feeds.update_exported(frames=exportlog.scan())
+            return feeds
+        return self._swap(_next)
+
+    def update_exported(self, paths: dict) -> Feeds:
+        '''Swap in a snapshot with the given jurisdictions' export status
+        re-read ({jurisdiction: path}, as sent by watcher.ExportWatcher).'''
+        return self._swap(lambda feeds: feeds.update_exported(paths))
+
+    def _swap(self, build) -> Feeds:
+        '''Build the next snapshot from the current one, swap it in and
+        save it. Saving under the lock keeps the saved snapshots in the
+        order they were swapped in.'''
+        with self._swap_lock:
+            version, feeds = self._snapshot
+            feeds = build(feeds)
+            self._snapshot = (version + 1, feeds)      # Single assignment, so readers never see a half-built snapshot.
+            feeds.save()                               # Share it with the other entry points.
+        return feeds
+
+    def _run(self):
+        '''Refresh every interval seconds until stopped.'''
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+                metrics.REFRESHES.inc(result='ok')
+            except Exception:
+                metrics.REFRESHES.inc(result='failed')
+                logger.exception('Refreshing feeds failed; keeping version %s.', self.version)
+
+    def start(self) -> 'Refresher':
+        '''Start refreshing in a daemon thread.'''
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='feeds-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def join(self, timeout: float=None):
+        '''Wait for the background thread to stop (at most timeout
+        seconds, if given).'''
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stop(self):
+        '''Stop the background thread.'''
+        self._stop.set()
+        self.join()
+
+class SnapshotReader:
+    '''Read-only counterpart of Refresher for serving workers (see
+    serve.py). A separate refresher process writes snapshots; each
+    worker memory-maps the latest one zero-copy, so memory stays flat
+    however many workers there are. The data version is the snapshot's
+    name. The LATEST pointer is re-checked at most every check_interval
+    seconds.'''
+    def __init__(
+        self,
+        directory: str=SNAPSHOT_DIR,
+        check_interval: float=SNAPSHOT_CHECK_INTERVAL
+    ):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._checked = 0.0
+        self._lock = Lock()
+        self._snapshot = None
+        while self._snapshot is None:                  # Wait for the refresher's first snapshot.
+            self._check()
+            if self._snapshot is None:
+                time.sleep(check_interval)
+
+    def _check(self):
+        '''Map the latest snapshot if it changed since the last check.'''
+        path = snapshot.latest(self.directory)
+        if path is None:
+            return
+        name = os.path.basename(path)
+        if self._snapshot is not None and self._snapshot[0] == name:
+            return
+        saved = snapshot.read(path, zero_copy=True)
+        if saved is not None:
+            self._snapshot = (name, Feeds.from_snapshot(saved))
+
+    @property
+    def version(self) -> str:
+        '''Current data version (the snapshot's name).'''
+        return self.snapshot()[0]
+
+    @property
+    def feeds(self) -> Feeds:
+        '''Current Feeds snapshot.'''
+        return self.snapshot()[1]
+
+    def snapshot(self) -> Tuple[str, Feeds]:
+        '''Current data version and Feeds snapshot, read together.'''
+        if time.monotonic() - self._checked > self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._checked = time.monotonic()
+                self._check()
+            except (OSError, ValueError):
+                logger.exception('Reading snapshot failed; keeping version %s.', self._snapshot[0])
+            finally:
+                self._lock.release()
+        return self._snapshot
@@ -0,0 +1,53 @@
+from setup import datetime
+from setup import get_configs
+from setup import os
+from threading import Lock
+from typing import Dict
+
+'''Module to hold the vendor configurations (configurations.json) for a
+long-running process. The parsed file is cached on its mtime and
+re-read only when it changes, and a weekday -> vendors index is built
+from the schedules, so "who is expected today" is a dict lookup.'''
+
+class ConfigRegistry:
+    '''Cached configurations file with a weekday index. version changes
+    whenever the file does, so callers can tell when to rebuild what
+    depends on it.'''
+    def __init__(
+        self,
+        path: str
+    ):
+        self.path = path
+        self._lock = Lock()
+        self._mtime = None
+        self._index: Dict[int, dict] = {}
+        self._reload()
+
+    def _reload(self):
+        '''Re-read and re-index the file if its mtime changed.'''
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            vendors, schedules = get_configs(self.path)
+            index = {i: {} for i in range(7)}
+            for vendor in vendors:
+                for weekday in schedules[vendors[vendor]['schedule']]:
+                    index[int(weekday)][vendor] = vendors[vendor]
+            self._index = index
+            self._mtime = mtime
+
+    @property
+    def version(self) -> int:
+        '''mtime (ns) of the file as last read, after checking for
+        changes.'''
+        self._reload()
+        return self._mtime
+
+    def expected(self, date: datetime=None) -> dict:
+        '''Configurations of the vendors expected on date (default:
+        today), as {vendor: configuration}. Don't modify the result.'''
+        self._reload()
+        return self._index[(date or datetime.now()).weekday()]
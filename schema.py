@@ -0,0 +1,135 @@
+import pandas as pd
+from pandas import DataFrame
+import pyarrow as pa
+from typing import Dict, Iterable, List
+
+'''Module to declare the columns and dtypes of every Feeds frame, in one
+place. Low-cardinality strings (vendor, company, feed and file types,
+statuses) are categoricals, numbers are nullable integers and dates are
+datetime64, so frames hold codes and arrays instead of millions of
+Python strings.'''
+
+CATEGORY = 'category'
+STRING = 'string'
+INT = 'Int64'
+DATETIME = 'datetime64[ns]'
+ARROW_TYPES = {                                        # dtype: Arrow type columns are streamed into.
+    CATEGORY: pa.string(),
+    STRING: pa.string(),
+    INT: pa.int64(),
+    DATETIME: pa.timestamp('ns')
+}
+PANDAS_TYPES = {                                       # Arrow type: dtype, when converting back.
+    pa.string(): pd.StringDtype(),
+    pa.int64(): pd.Int64Dtype()
+}
+
+SCHEMAS = {                                            # Frame: {column: dtype}, in column order.
+    'configs': {
+        'Vendor': STRING,
+        'Name': CATEGORY,
+        'Offset': INT,
+        'VendorNumber': INT
+    },
+    'expected': {
+        'Vendor': CATEGORY,
+        'Name': CATEGORY,
+        'FileMask': STRING,
+        'FileType': CATEGORY,
+        'Offset': INT,
+        'VendorNumber': INT,
+        'FeedType': CATEGORY
+    },
+    'actual': {
+        'FileMask': STRING,
+        'VendorNumber': INT,
+        'FeedType': CATEGORY,
+        'FileName': STRING,
+        'FileType': CATEGORY,
+        'Download': DATETIME,
+        'Archive': DATETIME,
+        'Start': DATETIME,
+        'End': DATETIME,
+        'VendorName': CATEGORY,
+        'Name': CATEGORY
+    },
+    'condensed_actuals': {
+        'VendorName': CATEGORY,
+        'Name': CATEGORY,
+        'Download': DATETIME,
+        'Start': DATETIME,
+        'End': DATETIME
+    },
+    'export_file': {                                   # Export status CSV, as written by BuildExportFileLog.ps1.
+        'Size': INT,
+        'ID': STRING,
+        'VendorName': STRING,
+        'LastModifiedTime': STRING,                    # Parsed into Modified after reading.
+        'Status': CATEGORY,
+        'SentAs': STRING
+    },
+    'exported': {
+        'Size': INT,
+        'ID': STRING,
+        'VendorName': STRING,
+        'Modified': DATETIME,
+        'Status': CATEGORY,
+        'SentAs': STRING,
+        'Name': CATEGORY
+    },
+    'feeds': {
+        'Status': CATEGORY,
+        'Vendor Name': STRING,
+        'Vendor Number': INT,
+        'Feed Type': CATEGORY,
+        'Processor': CATEGORY,
+        'Jurisdiction': CATEGORY,
+        'Download': DATETIME,
+        'Start': DATETIME,
+        'End': DATETIME,
+        'Export Created': DATETIME,
+        'Sent As': STRING
+    }
+}
+
+def columns(kind: str) -> List[str]:
+    return list(SCHEMAS[kind])
+
+def dtypes(kind: str) -> Dict[str, str]:
+    return dict(SCHEMAS[kind])
+
+def from_rows(kind: str, rows: list) -> DataFrame:
+    '''Build a frame from database rows, one typed column at a time,
+    without an intermediate object-dtype frame.'''
+    schema = SCHEMAS[kind]
+    values = list(zip(*rows)) if rows else [()] * len(schema)
+    return DataFrame({i: pd.Series(v, dtype=schema[i]) for i, v in zip(schema, values)})
+
+def from_columns(kind: str, batches: Iterable[tuple]) -> DataFrame:
+    '''Build a frame from batches of columns (see
+    Queries.stream_columns). Each batch becomes an Arrow record batch
+    as it arrives, so only one batch of Python objects is alive at a
+    time; categoricals are dictionary encoded once all batches are in.'''
+    schema = SCHEMAS[kind]
+    arrow = pa.schema([(i, ARROW_TYPES[v]) for i, v in schema.items()])
+    record_batches = []
+    for columns in batches:
+        if columns:
+            record_batches.append(pa.record_batch([pa.array(v, type=arrow.field(i).type) for i, v in zip(schema, columns)], schema=arrow))
+    table = pa.Table.from_batches(record_batches, schema=arrow)
+    for n, i in enumerate(schema):
+        if schema[i] == CATEGORY:
+            table = table.set_column(n, i, table[i].combine_chunks().dictionary_encode())
+    return apply(table.to_pandas(types_mapper=PANDAS_TYPES.get), kind)
+
+def empty(kind: str) -> DataFrame:
+    '''Empty frame with the schema's columns and dtypes.'''
+    return from_rows(kind, [])
+
+def apply(df: DataFrame, kind: str) -> DataFrame:
+    '''Cast the schema's columns present in df that have another dtype,
+    e.g. after a concat of categoricals with different categories or
+    a merge that introduced missing values.'''
+    schema = SCHEMAS[kind]
+    casts = {i: schema[i] for i in df.columns if i in schema and str(df[i].dtype) != schema[i]}
+    return df.astype(casts) if casts else df
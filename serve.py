@@ -0,0 +1,30 @@
+from refresh import Refresher
+from setup import EXPORT_SOURCE
+from watcher import ExportWatcher
+
+'''Production serving: one refresher process keeps the on-disk snapshot
+current, and any number of web workers memory-map it (see
+refresh.SnapshotReader), so there is one database pull and one copy of
+every frame however many workers run.
+
+    python serve.py
+    VENDORREPORT_SERVE_MODE=worker gunicorn --workers 4 --bind 0.0.0.0:9995 wsgi:server'''
+
+def run():
+    '''Refresh the snapshot in the background until interrupted.'''
+    refresher = Refresher().start()
+    watcher = None
+    if EXPORT_SOURCE != 'scan':                        # Scan mode rescans the archive on every refresh instead.
+        watcher = ExportWatcher(refresher.update_exported).start()
+    refresher.feeds.save()                             # Publish a snapshot for the workers right away.
+    try:
+        refresher.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        refresher.stop()
+
+if __name__ == '__main__':
+    run()
@@ -1,11 +1,15 @@
-from connection import Connection
 from datetime import datetime, timedelta
 import json
 import os
 import queries
+from threading import Lock
 from typing import Tuple
 
-'''This module controls "imports" and CONSTANTS creation.'''
+'''This module controls "imports" and CONSTANTS creation. Importing it
+has no side effects: POOL, QUERIES, TEMPLATES, CONFIGS and
+CONFIG_REGISTRY are built on first access (e.g. setup.POOL), so only the
+paths that need a database connection or the configurations file pay
+for them.'''
 
 def fetch_json_data(filepath: str) -> dict:
     '''Read external JSON file. Used primarily for broker feed
@@ -14,33 +18,97 @@ def fetch_json_data(filepath: str) -> dict:
 
 def get_configs(config_path: str) -> Tuple[dict, dict]:
     '''Read an external configurations file (configuratons.json), and
-    return the vendors and the delivery schedules.'''
+    return the vendors and the delivery schedules. The vendors are under
+    'brokers' in the shipped file ('vendors' is also accepted).'''
     configs = fetch_json_data(config_path)
-    return configs['vendors'], configs['schedules']
+    vendors = configs['brokers'] if 'brokers' in configs else configs['vendors']
+    return vendors, configs['schedules']
 
 def build_configs(config_path: str) -> dict:
     '''"Join" the vendors to their respective delivery schedule, with a
     twist: add entries only if the current date is in the delivery
-    schedule.'''
+    schedule. Long-running processes should use CONFIG_REGISTRY, which
+    follows edits to the file and the change of day.'''
     configs = get_configs(config_path)
     today = datetime.today().weekday()
     return {i: configs[0][i] for i in configs[0] if today in configs[1][configs[0][i]['schedule']]}
 
+def build_config_registry():
+    '''Registry of configurations.json (see registry.py).'''
+    from registry import ConfigRegistry
+    return ConfigRegistry(f'{THIS_DIR}/configurations.json')
+
 def get_templates():
     '''Get query templates for configured feeds, expected filemasks
-    (i.e., configurations) and for actual filemasks (i.e., filemasks).'''
+    (i.e., configurations), for actual filemasks (i.e., filemasks), for
+    the process log slice matched on the client and for the vendor ids
+    of the export file log.'''
     QUERY_TEMPLATES = queries.QueriesFactory()
     config_template = QUERY_TEMPLATES.get_template('configs')
     expected_template = QUERY_TEMPLATES.get_template('expected')
-    filemasks_template = QUERY_TEMPLATES.get_template('filemasks')
-    return config_template, expected_template, filemasks_template
+    filemasks_template = QUERY_TEMPLATES.get_template('filemask')
+    process_log_template = QUERY_TEMPLATES.get_template('process_log')
+    vendor_ids_template = QUERY_TEMPLATES.get_template('vendor_ids')
+    return config_template, expected_template, filemasks_template, process_log_template, vendor_ids_template
+
+def build_pool():
+    '''Connection pool for the database. connection (and so pyodbc) is
+    only imported when the pool is first needed.'''
+    from connection import ConnectionPool
+    return ConnectionPool(size=POOL_SIZE)
+
+def build_queries():
+    '''Queries runner, with the result cache of the slow-changing
+    templates (see querycache.py).'''
+    from querycache import QueryCache
+    return queries.Queries(cache=QueryCache(QUERY_CACHE_DIR, QUERY_CACHE_TTL))
+
+_LAZY = {
+    'POOL': build_pool,
+    'QUERIES': build_queries,
+    'TEMPLATES': get_templates,
+    'CONFIGS': lambda: build_configs(f'{THIS_DIR}/configurations.json'),
+    'CONFIG_REGISTRY': build_config_registry
+}
+_LAZY_LOCK = Lock()
+
+def __getattr__(name: str):
+    '''Build lazily initialized CONSTANTS on first access and cache them
+    as module globals, so later lookups don't come back here.'''
+    if name not in _LAZY:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    with _LAZY_LOCK:
+        if name not in globals():
+            globals()[name] = _LAZY[name]()
+    return globals()[name]
 
 '''CONSTANTS'''
 THIS_DIR = f'{os.path.dirname(os.path.abspath(__file__))}'
-CONN = Connection()
-QUERIES = queries.Queries()
-TEMPLATES = get_templates()
-CONFIGS = build_configs(f'{THIS_DIR}/configurations.json')
+POOL_SIZE = 4
+BUILD_WORKERS = 4                    # Threads for the independent Feeds build stages (see dag.py).
+ACTUAL_ENGINE = 'sql'                # 'sql' (CROSS APPLY) or 'client' (matcher.py).
+FETCH_BATCH_SIZE = 10000
+QUERY_CACHE_DIR = f'{THIS_DIR}/cache'
+QUERY_CACHE_TTL = 3600               # Seconds Configs and Expected results are cached; 0 disables the cache.
+MATCH_DOP = 1                        # Parallel shards (and connections) for the 'sql' engine; 1 is a single query.
+REFRESH_INTERVAL = 300               # Seconds between background refreshes.
+EXPORTS_DIR = f'{THIS_DIR}/exports'
+EXPORT_DATA_DIR = f'{THIS_DIR}/data'  # Where export.py writes frames for BI tools.
+EXPORTS_POLL_INTERVAL = 5            # Seconds between scans when inotify isn't available.
+EXPORT_SOURCE = 'files'              # 'files' (status CSVs in EXPORTS_DIR) or 'scan' (exportlog.py).
+EXPORT_LOG_DIR = f'{THIS_DIR}/ExportFileLog' # One <jurisdiction>/Configurations.xml per jurisdiction.
+ARCHIVE_DIR = os.environ.get('VENDORREPORT_ARCHIVE_DIR', 'C:/Archive') # Where the export zips are archived.
+HISTORY_DIR = f'{THIS_DIR}/history'
+SNAPSHOT_DIR = f'{THIS_DIR}/snapshots'
+SNAPSHOT_TTL = 300                   # Seconds a saved snapshot is fresh enough to load.
+SNAPSHOT_CHECK_INTERVAL = 2          # Seconds between serving workers' checks for a new snapshot.
+LIVE_UPDATE_INTERVAL = 10            # Seconds between dashboards' polls for a new data version.
+SERVE_MODE = os.environ.get('VENDORREPORT_SERVE_MODE', 'standalone') # 'standalone' or 'worker' (see serve.py).
+AGGREGATIONS = {                     # Condensed column: (actual column, aggregate function or percentile).
+    'Download': ('Download', 'min'),
+    'Start': ('Start', 'min'),
+    'End': ('End', 'max')
+}                                    # Only what the feeds table shows; e.g. ('FileName', 'last') or ('Duration', 'p95') also work.
 FILETYPES_TO_IGNORE = {
     'ZIP',
     'Reference'
@@ -0,0 +1,146 @@
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from setup import datetime
+from setup import os
+from setup import SNAPSHOT_DIR
+from setup import SNAPSHOT_TTL
+import shutil
+from threading import get_ident, Lock
+from typing import Optional
+
+'''Module to persist Feeds frames as an on-disk Arrow IPC (Feather v2)
+snapshot, so entry points can load a recent build in milliseconds
+instead of querying the database again.
+
+Layout:
+    snapshots/<YYYYmmddTHHMMSSffffff>/<frame>.arrow
+    snapshots/<YYYYmmddTHHMMSSffffff>/manifest.json
+    snapshots/LATEST (name of the newest complete snapshot)'''
+
+FORMAT_VERSION = 1
+FRAMES = (
+    'configs',
+    'expected',
+    'all_actuals',
+    'condensed_actuals',
+    'exported',
+    'feeds'
+)
+ATTRIBUTES = (
+    'now',
+    'refreshed_at',
+    'watermark',
+    'build_seconds',
+    'config_version'
+)
+_POINTER_LOCK = Lock()                                 # Serializes this process's pointer updates.
+
+def _frame_path(path: str, frame: str) -> str:
+    return f'{path}/{frame}.arrow'
+
+def _read_pointer(directory: str) -> Optional[str]:
+    '''Name of the snapshot LATEST points at, if any.'''
+    try:
+        with open(f'{directory}/LATEST', 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _write_pointer(directory: str, name: str):
+    '''Atomically point LATEST at the named snapshot, unless it already
+    points at a newer one (names sort by creation time). Each writer
+    has its own temp file, so concurrent saves can't replace each
+    other's.'''
+    with _POINTER_LOCK:
+        current = _read_pointer(directory)
+        if current is not None and current > name:
+            return
+        tmp = f'{directory}/LATEST.{os.getpid()}.{get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(name)
+        os.replace(tmp, f'{directory}/LATEST')
+
+def _prune(directory: str, keep: int):
+    '''Remove all but the newest keep snapshots.'''
+    names = sorted(i for i in os.listdir(directory) if os.path.isdir(f'{directory}/{i}') and not i.endswith('.tmp'))
+    for i in names[:-keep]:
+        shutil.rmtree(f'{directory}/{i}', ignore_errors=True)
+
+def _dump(value):
+    '''Attributes are datetimes (stored as ISO strings) or numbers.'''
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def save(frames: dict, attributes: dict, directory: str=SNAPSHOT_DIR, keep: int=3) -> str:
+    '''Write the frames and the attributes as a new snapshot.
+    Frames are written uncompressed so they can be memory-mapped. The
+    snapshot is built in a temporary directory and renamed into place,
+    so readers never see a partial one.'''
+    created = datetime.now()
+    name = created.strftime('%Y%m%dT%H%M%S%f')
+    tmp = f'{directory}/{name}.tmp'
+    os.makedirs(tmp, exist_ok=True)
+
+    for i in FRAMES:
+        feather.write_feather(frames[i].reset_index(drop=True), _frame_path(tmp, i), compression='uncompressed')
+    manifest = {
+        'format': FORMAT_VERSION,
+        'created': created.isoformat(),
+        'attributes': {i: _dump(attributes.get(i)) for i in ATTRIBUTES}
+    }
+    with open(f'{tmp}/manifest.json', 'w') as f:
+        json.dump(manifest, f)
+
+    os.replace(tmp, f'{directory}/{name}')
+    _write_pointer(directory, name)
+    _prune(directory, keep)
+    return f'{directory}/{name}'
+
+def latest(directory: str=SNAPSHOT_DIR) -> Optional[str]:
+    '''Path of the newest complete snapshot, if there is one.'''
+    name = _read_pointer(directory)
+    if name is None:
+        return None
+    path = f'{directory}/{name}'
+    return path if os.path.isdir(path) else None
+
+def _zero_copy_type(arrow_type: pa.DataType):
+    '''Arrow-backed dtype for a column, or None (pandas' default
+    conversion) for dictionaries.'''
+    return None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
+
+def _manifest(path: str) -> dict:
+    with open(f'{path}/manifest.json', 'r') as f:
+        return json.load(f)
+
+def read(path: str, zero_copy: bool=False) -> Optional[dict]:
+    '''Read a snapshot directory, memory-mapped. Returns
+    {'frames': {...}, 'attributes': {...}, 'created': datetime}, or None
+    if it is in another format. With zero_copy, columns are backed by
+    Arrow (pd.ArrowDtype) so they keep pointing into the mapped file and
+    every process mapping it shares the same pages. Dictionary columns
+    (the schema's categoricals) become pd.Categorical, as pandas can't
+    sort or compare Arrow dictionaries; only their small dictionaries
+    and codes are copied.'''
+    manifest = _manifest(path)
+    if manifest['format'] != FORMAT_VERSION:
+        return None
+
+    types_mapper = _zero_copy_type if zero_copy else None
+    frames = {i: feather.read_table(_frame_path(path, i), memory_map=True).to_pandas(types_mapper=types_mapper) for i in FRAMES}
+    attributes = {
+        i: datetime.fromisoformat(v) if isinstance(v, str) else v for i, v in manifest['attributes'].items()
+    }
+    return {'frames': frames, 'attributes': attributes, 'created': datetime.fromisoformat(manifest['created'])}
+
+def load(directory: str=SNAPSHOT_DIR, ttl: float=SNAPSHOT_TTL) -> Optional[dict]:
+    '''Load the newest snapshot if it is younger than ttl seconds and in
+    the current format, or None if there is no fresh-enough snapshot.'''
+    path = latest(directory)
+    if path is None:
+        return None
+    created = datetime.fromisoformat(_manifest(path)['created'])
+    if (datetime.now() - created).total_seconds() > ttl:
+        return None
+    return read(path)
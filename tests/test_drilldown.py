@@ -0,0 +1,56 @@
+from data import Feeds
+import drilldown
+import pytest
+import schema
+from setup import datetime
+from setup import timedelta
+import snapshot
+
+'''The vendor drilldown on frames read from a snapshot, as the serving
+workers read them (zero copy) and as a single process does.'''
+
+def actual_rows(n: int=60) -> list:
+    start = datetime(2026, 10, 18, 6)
+    return [
+        (
+            f'V{i % 3}F', i % 3, ['Vendor', 'Indirect'][i % 2], f'V{i % 3}F_{i:03d}.csv', ['Positions', 'Balances', 'Transactions'][i % 3],
+            start + timedelta(minutes=i), None, start + timedelta(minutes=i + 1), start + timedelta(minutes=i + 5),
+            f'vendor{i % 3}', f'crm{i % 4}'
+        ) for i in range(n)
+    ]
+
+@pytest.fixture
+def snapshots(tmp_path) -> dict:
+    frames = {i: schema.empty(i if i != 'all_actuals' else 'actual') for i in snapshot.FRAMES}
+    frames['all_actuals'] = schema.from_rows('actual', actual_rows())
+    path = snapshot.save(frames, {}, str(tmp_path))
+    return {
+        zero_copy: Feeds.from_snapshot(snapshot.read(path, zero_copy=zero_copy)) for zero_copy in (True, False)
+    }
+
+@pytest.mark.parametrize('column', schema.columns('actual'))
+@pytest.mark.parametrize('direction', ['asc', 'desc'])
+def test_sort(snapshots, column, direction):
+    pages = [
+        drilldown.query(feeds.vendor_rows('vendor1'), 1, 5, [{'column_id': column, 'direction': direction}], '')
+        for feeds in snapshots.values()
+    ]
+    assert pages[0][1] == 4
+    assert [i['FileName'] for i in pages[0][0]] == [i['FileName'] for i in pages[1][0]]
+
+@pytest.mark.parametrize('filter_query', [
+    '{Name} eq "crm1"',
+    '{Name} ne "crm1"',
+    '{Name} ge "crm2"',
+    '{FileType} contains "bal"',
+    '{FeedType} eq "Indirect" && {Name} lt "crm3"',
+    '{VendorNumber} gt 0',
+    '{Download} datestartswith "2026-10-18"'
+])
+def test_filter(snapshots, filter_query):
+    pages = [
+        drilldown.query(feeds.vendor_rows('vendor1'), 0, 50, [{'column_id': 'Name', 'direction': 'desc'}], filter_query)
+        for feeds in snapshots.values()
+    ]
+    assert [i['FileName'] for i in pages[0][0]] == [i['FileName'] for i in pages[1][0]]
+    assert pages[0][0]
@@ -0,0 +1,138 @@
+from benchmarks import synthetic
+from connection import ConnectionPool
+from connection import SQLiteConnection
+from df import build_export_df
+import exportlog
+from glob import glob
+import pandas as pd
+import pytest
+from queries import Queries
+import setup
+from setup import datetime
+from setup import os
+from setup import timedelta
+
+'''exportlog.py against archive trees with known contents: a small
+hand-built one checked row by row, and one from
+benchmarks.synthetic.generate_archive checked against the files on
+disk.'''
+
+NOW = datetime(2026, 10, 18, 15, 30)
+MIDNIGHT = datetime(2026, 10, 18)
+TODAY = '2026.10.18'
+YESTERDAY = '2026.10.17'
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    '''Synthetic database with vendor00001.. as vendor ids 1..'''
+    paths = synthetic.generate(str(tmp_path), vendors=300, masks_per_vendor=1, log_rows=10, days=1, now=NOW)
+    monkeypatch.setattr(setup, 'POOL', ConnectionPool(size=2, factory=SQLiteConnection, path=paths['database']), raising=False)
+    monkeypatch.setattr(setup, 'TEMPLATES', synthetic.sqlite_templates(), raising=False)
+    monkeypatch.setattr(setup, 'QUERIES', Queries(), raising=False)
+    return tmp_path
+
+def configurations(directory, jurisdiction: str, ftp: str, vendors: list):
+    os.makedirs(f'{directory}/{jurisdiction}', exist_ok=True)
+    custodians = ''.join(f'<Custodian> {i} </Custodian>' for i in vendors)
+    with open(f'{directory}/{jurisdiction}/Configurations.xml', 'w') as f:
+        f.write(
+            f'<?xml version="1.0"?><configurations><ExportFileString><Name>{ftp}</Name></ExportFileString>'
+            f'<VendorsInScope>{custodians}<Custodian></Custodian></VendorsInScope></configurations>'
+        )
+
+def archived(directory, name: str, modified: datetime, size: int=10):
+    path = f'{directory}/{name}'
+    with open(path, 'wb') as f:
+        f.write(b'0' * size)
+    os.utime(path, (modified.timestamp(), modified.timestamp()))
+
+@pytest.fixture
+def tree(database):
+    '''Two jurisdictions; vendor ids are the vendors' numbers.'''
+    log, archive = database / 'ExportFileLog', database / 'archive'
+    os.makedirs(archive)
+    configurations(log, 'JUR1', 'ftpA', ['vendor00001', 'vendor00002', 'vendor00003', 'nobody'])
+    configurations(log, 'JUR2', 'ftpB', ['vendor00004', 'vendor00005'])
+    os.makedirs(log / 'empty')                         # No Configurations.xml: not a jurisdiction.
+    today = MIDNIGHT + timedelta(hours=9)
+    archived(archive, f'ftpA_{TODAY}_1_000001_PTCCData.zip', today, 20)
+    archived(archive, f'ftpA_{TODAY}_1_000000_PTCCData.zip', today + timedelta(hours=1), 30)
+    archived(archive, f'ftpA_{TODAY}_1_ftpA-renamed.ZIP', today, 40)
+    archived(archive, f'ftpA_{TODAY}_11_000000_PTCCData.zip', today)           # Another vendor id.
+    archived(archive, f'ftpA_{YESTERDAY}_2_000000_PTCCData.zip', today - timedelta(days=1))
+    archived(archive, f'ftpA_{TODAY}_2_000000_PTCCData.zip', MIDNIGHT - timedelta(minutes=5))
+    archived(archive, f'ftpB_{TODAY}_3_000000_PTCCData.zip', today)             # vendor00003 is JUR1's.
+    archived(archive, f'ftpB_{TODAY}_4_000000_PTCCData.zip', today, 50)
+    archived(archive, f'ftpB_{TODAY}_4_000000_PTCCData.txt', today)
+    os.makedirs(archive / f'ftpB_{TODAY}_5_folder.zip')
+    return str(log), str(archive)
+
+def test_configurations(tree):
+    log, _ = tree
+    assert exportlog.jurisdictions(log) == {
+        'JUR1': ('ftpA', ['vendor00001', 'vendor00002', 'vendor00003', 'nobody']),
+        'JUR2': ('ftpB', ['vendor00004', 'vendor00005'])
+    }
+
+def test_vendor_ids(database):
+    assert exportlog.vendor_ids(['vendor00002', 'vendor00010', 'nobody', 'vendor00002']) == {'vendor00002': '2', 'vendor00010': '10'}
+    assert exportlog.vendor_ids([]) == {}
+
+def test_scan(tree):
+    frames = exportlog.scan(*tree, now=NOW)
+    modified = pd.Timestamp(MIDNIGHT + timedelta(hours=9))
+    rows = {
+        i: [tuple(None if pd.isnull(v) else v for v in row) for row in df.itertuples(index=False)]
+        for i, df in frames.items()
+    }
+    assert rows == {
+        'JUR1': [
+            (30, '1', 'vendor00001', modified + pd.Timedelta(hours=1), 'Sent', f'ftpA_{TODAY}_1_000000_PTCCData.zip', 'JUR1'),
+            (20, '1', 'vendor00001', modified, 'Sent', f'ftpA_{TODAY}_1_000001_PTCCData.zip', 'JUR1'),
+            (40, '1', 'vendor00001', modified, 'Sent', f'ftpA_{TODAY}_1_renamed.ZIP', 'JUR1'),
+            (None, '2', 'vendor00002', None, 'Not Sent', None, 'JUR1'),
+            (None, '3', 'vendor00003', None, 'Not Sent', None, 'JUR1')
+        ],
+        'JUR2': [
+            (50, '4', 'vendor00004', modified, 'Sent', f'ftpB_{TODAY}_4_000000_PTCCData.zip', 'JUR2'),
+            (None, '5', 'vendor00005', None, 'Not Sent', None, 'JUR2')
+        ]
+    }
+
+def test_write_status(tree, tmp_path):
+    frames = exportlog.scan(*tree, now=NOW)
+    paths = exportlog.write_status(frames, str(tmp_path / 'exports'), '20261018 153000')
+    assert sorted(os.path.basename(i) for i in paths) == ['JUR1_status_20261018 153000.csv', 'JUR2_status_20261018 153000.csv']
+    assert not glob(f'{tmp_path}/exports/*.tmp')
+    with open(paths[1], newline='') as f:
+        assert f.read().splitlines() == [
+            '"Size","ID","VendorName","LastModifiedTime","Status","SentAs"',
+            f'"50","4","vendor00004","10/18/2026 9:00:00 AM","Sent","ftpB_{TODAY}_4_000000_PTCCData.zip"',
+            '"","5","vendor00005","","Not Sent",""'
+        ]
+    assert build_export_df(paths=dict(zip(frames, paths))).equals(build_export_df(frames=frames))
+
+def test_generated_archive(database):
+    now = datetime.now()
+    paths = synthetic.generate_archive(str(database), vendors=300, now=now, seed=3)
+    frames = exportlog.scan(paths['configurations'], paths['archive'], now)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    assert sorted(frames) == synthetic.JURISDICTIONS
+    for j, (jurisdiction, df) in enumerate(frames.items()):
+        ftp = f'ftp{j}'
+        ids = [str(i) for i in range(j + 1, 301, len(synthetic.JURISDICTIONS))]
+        assert df['ID'].drop_duplicates().tolist() == ids
+        for id, rows in df.groupby('ID', sort=False):
+            names = sorted(
+                os.path.basename(i) for i in glob(f'{paths["archive"]}/{ftp}_{now:%Y.%m.%d}_{id}_*.zip')
+                if os.stat(i).st_mtime > midnight
+            )
+            assert rows['VendorName'].tolist() == [f'vendor{int(id):05d}'] * len(rows)
+            if names:
+                assert rows['Status'].tolist() == ['Sent'] * len(names)
+                assert rows['SentAs'].tolist() == names
+                assert rows['Size'].tolist() == [os.stat(f'{paths["archive"]}/{i}').st_size for i in names]
+            else:
+                assert rows['Status'].tolist() == ['Not Sent']
+    statuses = pd.concat(frames.values())['Status'].value_counts()
+    assert statuses['Sent'] > 0 and statuses['Not Sent'] > 0
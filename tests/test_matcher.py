@@ -0,0 +1,91 @@
+from benchmarks import synthetic
+from connection import ConnectionPool
+from connection import SQLiteConnection
+from data import Feeds
+from fnmatch import fnmatchcase
+from matcher import like_to_regex
+import pytest
+from queries import Queries
+import re
+from registry import ConfigRegistry
+import setup
+from setup import datetime
+import sqlite3
+
+'''The 'client' engine (matcher.py) against LIKE as SQL Server
+evaluates it, and against the 'sql' engine on the synthetic database.'''
+
+def sql_server_like(pattern: str, value: str) -> bool:
+    '''value LIKE pattern, case insensitive, with % _ [] [^] wildcards.
+    Translated to fnmatch independently of matcher.like_to_regex.'''
+    glob, i = '', 0
+    while i < len(pattern):
+        char = pattern[i]
+        end = pattern.find(']', i + 1) if char == '[' else -1
+        if char == '%':
+            glob += '*'
+        elif char == '_':
+            glob += '?'
+        elif end != -1:
+            group = pattern[i + 1:end]
+            glob += '[!' + group[1:] + ']' if group.startswith('^') else '[' + group + ']'
+            i = end
+        else:
+            glob += '[' + char + ']' if char in '*?[' else char
+        i += 1
+    return fnmatchcase(str(value).lower(), glob.lower())
+
+@pytest.mark.parametrize('mask, filename', [
+    ('v1f[0-9]_', 'V1F5_20261018.csv'),
+    ('v1f[0-9]_', 'V1F-_20261018.csv'),
+    ('v1f[0-9]_', 'V1F0_20261018.csv'),
+    ('v1f[0-9]_', 'V1F9_20261018.csv'),
+    ('v1f[a-c]', 'v1fb.csv'),
+    ('v1f[a-c]', 'v1fd.csv'),
+    ('v1f[^0-9]', 'v1fx.csv'),
+    ('v1f[^0-9]', 'v1f7.csv'),
+    ('v1f[-9]', 'v1f-.csv'),
+    ('v1f[-9]', 'v1f5.csv'),
+    ('v1f[.]csv', 'v1f.csv'),
+    ('v1f[.]csv', 'v1fxcsv'),
+    ('v1f[[]', 'v1f[.csv'),
+    ('a%b_c', 'xxaZZZbQc.csv'),
+    ('a%b_c', 'acb.csv'),
+    ('100%', 'file_100.csv')
+])
+def test_like_to_regex(mask, filename):
+    assert bool(like_to_regex(mask).search(filename.lower())) == sql_server_like(f'%{mask}%', filename)
+
+class LikeConnection(SQLiteConnection):
+    '''SQLite connection whose LIKE behaves as SQL Server's.'''
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._connection.create_function('like', 2, sql_server_like)
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    '''Small synthetic database, with masks using [0-9] and [^0-9]
+    ranges and the _ wildcard.'''
+    now = datetime.now()
+    paths = synthetic.generate(str(tmp_path), vendors=40, masks_per_vendor=3, log_rows=3000, days=3, now=now, seed=1)
+    conn = sqlite3.connect(paths['database'])
+    masks = conn.execute('select id, mask from file_config').fetchall()
+    ranges = {i: re.sub(r'F\d', 'F[0-9]' if i % 3 == 0 else 'F[^0]', mask) for i, mask in masks if i % 3 != 1}
+    conn.executemany('update file_config set mask = ? where id = ?', [(v, i) for i, v in ranges.items()])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(setup, 'POOL', ConnectionPool(size=2, factory=LikeConnection, path=paths['database']), raising=False)
+    monkeypatch.setattr(setup, 'TEMPLATES', synthetic.sqlite_templates(), raising=False)
+    monkeypatch.setattr(setup, 'QUERIES', Queries(), raising=False)
+    monkeypatch.setattr(setup, 'CONFIG_REGISTRY', ConfigRegistry(paths['configurations']), raising=False)
+    return now
+
+def test_engines_agree(database):
+    now = database
+    expected = Feeds.Expected(Feeds.Configs(now).configs, now).expected
+    assert expected['FileMask'].str.contains(r'\[0-9\]', regex=True).any()
+    assert expected['FileMask'].str.contains(r'\[\^0\]', regex=True).any()
+    frames = [Feeds.Actual(expected, engine).actual[0] for engine in ('sql', 'client')]
+    sql, client = [i.astype(str).sort_values(list(i.columns)).reset_index(drop=True) for i in frames]
+    assert len(sql) > 0
+    assert sql.equals(client)
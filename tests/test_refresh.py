@@ -0,0 +1,45 @@
+import exportlog
+import refresh
+from refresh import Refresher
+import setup
+from setup import datetime
+
+'''Refresher.refresh's choice of build per tick, with a stand-in for
+Feeds that records the calls.'''
+
+class FakeFeeds:
+    def __init__(self):
+        self.now = datetime.now()
+        self.config_version = setup.CONFIG_REGISTRY.version
+        self.calls = []
+
+    def refresh(self):
+        self.calls.append('refresh')
+        return self
+
+    def update_exported(self, paths=None, frames=None):
+        self.calls.append(('update_exported', paths, frames))
+        return self
+
+    def save(self):
+        pass
+
+def test_refresh_files(monkeypatch):
+    monkeypatch.setattr(refresh, 'EXPORT_SOURCE', 'files')
+    feeds = FakeFeeds()
+    Refresher(feeds=feeds).refresh()
+    assert feeds.calls == ['refresh']
+
+def test_refresh_scan(monkeypatch):
+    scans = []
+    monkeypatch.setattr(refresh, 'EXPORT_SOURCE', 'scan')
+    monkeypatch.setattr(exportlog, 'scan', lambda: scans.append(len(scans)) or {'JUR1': len(scans)})
+    feeds = FakeFeeds()
+    refresher = Refresher(feeds=feeds)
+    refresher.refresh()
+    refresher.refresh()
+    assert feeds.calls == [
+        'refresh', ('update_exported', None, {'JUR1': 1}),
+        'refresh', ('update_exported', None, {'JUR1': 2})
+    ]
+    assert refresher.version == 3
@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from setup import datetime
+from setup import os
+import snapshot
+
+'''Snapshot saving and the LATEST pointer.'''
+
+def frames() -> dict:
+    return {i: pd.DataFrame({'a': [1, 2]}) for i in snapshot.FRAMES}
+
+def test_concurrent_saves(tmp_path):
+    directory = str(tmp_path)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(lambda _: snapshot.save(frames(), {'now': datetime.now()}, directory, keep=100), range(32)))
+    assert snapshot.latest(directory) == max(paths)
+    assert not [i for i in os.listdir(directory) if i.endswith('.tmp')]
+
+def test_older_snapshot_not_published(tmp_path):
+    directory = str(tmp_path)
+    newer = snapshot.save(frames(), {}, directory)
+    snapshot._write_pointer(directory, '20000101T000000000000')
+    assert snapshot.latest(directory) == newer
@@ -0,0 +1,142 @@
+import logging
+import re
+from setup import EXPORTS_DIR
+from setup import EXPORTS_POLL_INTERVAL
+from setup import os
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    from inotify_simple import flags, INotify
+except ImportError:                                    # Not on Linux, or not installed: poll instead.
+    INotify = None
+
+'''Module to watch the exports directory for new
+<jurisdiction>_status_*.csv files (written by BuildExportFileLog.ps1),
+and keep an index of the latest file per jurisdiction. Uses inotify
+where available, and polls the directory otherwise.'''
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FILE = re.compile(r'(?P<jurisdiction>[^_]+)_status_.*\.csv', re.IGNORECASE)
+
+def latest_exports(directory: str=EXPORTS_DIR) -> Dict[str, Tuple[str, float]]:
+    '''One pass over the directory: the latest (by mtime) status file
+    for each jurisdiction, as {jurisdiction: (path, mtime)}.'''
+    latest = {}
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return latest
+    for entry in entries:
+        match = EXPORT_FILE.fullmatch(entry.name)
+        if match is None or not entry.is_file():
+            continue
+        mtime = entry.stat().st_mtime
+        jurisdiction = match.group('jurisdiction')
+        if jurisdiction not in latest or mtime > latest[jurisdiction][1]:
+            latest[jurisdiction] = (entry.path, mtime)
+    return latest
+
+class ExportIndex:
+    '''In-memory index of the latest status file per jurisdiction.'''
+    def __init__(
+        self,
+        directory: str=EXPORTS_DIR
+    ):
+        self.directory = directory
+        self._latest = latest_exports(directory)
+        self._lock = Lock()
+
+    def paths(self) -> Dict[str, str]:
+        '''Latest file path per jurisdiction.'''
+        with self._lock:
+            return {i: v[0] for i, v in self._latest.items()}
+
+    def update(self, name: str) -> Optional[str]:
+        '''Record a created or modified file. Returns its jurisdiction if
+        it is now that jurisdiction's latest file.'''
+        match = EXPORT_FILE.fullmatch(name)
+        if match is None:
+            return None
+        path = f'{self.directory}/{name}'
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        jurisdiction = match.group('jurisdiction')
+        with self._lock:
+            current = self._latest.get(jurisdiction)
+            if current is not None and current[1] > mtime:
+                return None
+            self._latest[jurisdiction] = (path, mtime)
+        return jurisdiction
+
+    def rescan(self) -> Dict[str, str]:
+        '''Rescan the directory. Returns the jurisdictions whose latest
+        file changed, with their new paths.'''
+        latest = latest_exports(self.directory)
+        with self._lock:
+            changed = {i: v[0] for i, v in latest.items() if self._latest.get(i) != v}
+            self._latest = latest
+        return changed
+
+class ExportWatcher:
+    '''Watch the exports directory and call callback with
+    {jurisdiction: path} for the jurisdictions whose latest file
+    changed.'''
+    def __init__(
+        self,
+        callback: Callable[[Dict[str, str]], None],
+        index: ExportIndex=None,
+        poll_interval: float=EXPORTS_POLL_INTERVAL
+    ):
+        self.callback = callback
+        self.index = index or ExportIndex()
+        self.poll_interval = poll_interval
+        self._stop = Event()
+        self._thread = None
+
+    def _notify(self, changed: Dict[str, str]):
+        if not changed:
+            return
+        try:
+            self.callback(changed)
+        except Exception:
+            logger.exception('Updating exports for %s failed.', sorted(changed))
+
+    def _watch(self):
+        '''Block on inotify events for files written or moved into the
+        directory.'''
+        inotify = INotify()
+        inotify.add_watch(self.index.directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+        try:
+            while not self._stop.is_set():
+                changed = {}
+                for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+                    jurisdiction = self.index.update(event.name)
+                    if jurisdiction is not None:
+                        changed[jurisdiction] = f'{self.index.directory}/{event.name}'
+                self._notify(changed)
+        finally:
+            inotify.close()
+
+    def _poll(self):
+        '''Rescan the directory every poll_interval seconds.'''
+        while not self._stop.wait(self.poll_interval):
+            self._notify(self.index.rescan())
+
+    def start(self) -> 'ExportWatcher':
+        '''Start watching in a daemon thread.'''
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            target = self._watch if INotify is not None else self._poll
+            self._thread = Thread(target=target, name='exports-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        '''Stop the background thread.'''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
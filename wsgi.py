@@ -0,0 +1,7 @@
+from app import app
+
+'''WSGI entry point for serving the dashboard with several workers, e.g.
+VENDORREPORT_SERVE_MODE=worker gunicorn --workers 4 wsgi:server
+(see serve.py).'''
+
+server = app.server